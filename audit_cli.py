@@ -0,0 +1,269 @@
+# =====================================
+# 命令行批量审核：每个月份目录放 4 个输入文件 (项目提成、放款明细、二次明细、产品台账)，
+# 审核结果按月份写入输出目录。
+# 用法: python audit_cli.py data/2024-01 data/2024-02 ... -o out/ --workers 4
+# =====================================
+
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+from audit_engine import (
+    AUDIT_CHUNK_ROWS,
+    AUDIT_PROFILE,
+    AUDIT_RULES,
+    REFERENCE_SNAPSHOT_DIR,
+    AuditReporter,
+    BufferedReporter,
+    ReferenceCache,
+    ReferenceSnapshotStore,
+    find_file,
+    run_full_audit,
+)
+
+# 参考文件关键词 -> ReferenceCache 中的参考类型 (来自规则文件 references)
+REFERENCE_FILE_KEYWORDS = {keyword: source for source, keyword in AUDIT_RULES.reference_files.items()}
+
+# =====================================
+# 📣 控制台输出
+# =====================================
+class ConsoleReporter(AuditReporter):
+    """把引擎消息逐行写到 stderr，带月份前缀；进度状态只在 verbose 时输出。"""
+
+    def __init__(self, prefix="", verbose=False, stream=None):
+        self.prefix = prefix
+        self.verbose = verbose
+        self.stream = stream or sys.stderr
+
+    def _print(self, text):
+        print(f"[{self.prefix}] {text}" if self.prefix else text, file=self.stream, flush=True)
+
+    def message(self, level, text):
+        self._print(text)
+
+    def status(self, key, text):
+        if self.verbose:
+            self._print(text)
+
+class QuietReporter(AuditReporter):
+    """只输出错误。"""
+
+    def __init__(self, prefix=""):
+        self._console = ConsoleReporter(prefix)
+
+    def message(self, level, text):
+        if level == "error":
+            self._console.message(level, text)
+
+def make_reporter(prefix, quiet=False, verbose=False):
+    return QuietReporter(prefix) if quiet else ConsoleReporter(prefix, verbose=verbose)
+
+# =====================================
+# 🗂️ 月份目录读写
+# =====================================
+def month_name(month_dir):
+    return os.path.basename(os.path.normpath(month_dir))
+
+def read_month_files(month_dir):
+    """读取目录下所有 xlsx (跳过 Excel 临时文件)，返回带 name 属性的 BytesIO 列表。"""
+    files = []
+    for name in sorted(os.listdir(month_dir)):
+        if not name.lower().endswith(".xlsx") or name.startswith("~$"):
+            continue
+        with open(os.path.join(month_dir, name), "rb") as fh:
+            f = BytesIO(fh.read())
+        f.name = name
+        files.append(f)
+    return files
+
+def describe_error(e):
+    """异常类型与说明，写入日志与月份摘要。"""
+    return f"{type(e).__name__}: {e}"
+
+def preload_references(month_dirs, ref_cache, reporter):
+    """先把各月份用到的参考文件按内容去重后读入 ref_cache，相同文件只处理一次。"""
+    for month_dir in month_dirs:
+        try:
+            files = read_month_files(month_dir)
+            for kw, prefix in REFERENCE_FILE_KEYWORDS.items():
+                ref_cache.get(prefix, find_file(files, kw), reporter)
+        except Exception as e:
+            # 缺文件、文件损坏等月份留到正式审核时再报错，不影响其他月份预读
+            reporter.warning(f"⚠️ {month_name(month_dir)}: 参考文件预读失败 ({describe_error(e)})")
+
+def audit_month(month_dir, output_dir, reporter, ref_cache, sheet_workers=1, chunk_rows=0,
+                profile=AUDIT_PROFILE):
+    """
+    审核一个月份目录并写出结果文件，返回该月份的摘要 dict。
+    任何异常 (缺文件、文件损坏等) 只记入该月份摘要的 error，不中断其余月份。
+    """
+    name = month_name(month_dir)
+    summary = {"month": name, "input_dir": os.path.abspath(month_dir)}
+    t0 = time.perf_counter()
+    try:
+        _audit_month(month_dir, output_dir, reporter, ref_cache, sheet_workers, chunk_rows, profile, summary)
+    except Exception as e:
+        reporter.error(f"❌ 审核失败 ({describe_error(e)})")
+        summary.update(error=describe_error(e), error_type=type(e).__name__)
+    summary["seconds"] = round(time.perf_counter() - t0, 3)
+    return summary
+
+def _audit_month(month_dir, output_dir, reporter, ref_cache, sheet_workers, chunk_rows, profile, summary):
+    """audit_month 的主体：审核并写出结果文件，结果记入 summary。"""
+    files = read_month_files(month_dir)
+    # 所有结果文件都要写出：审核时即生成 (不按需生成，避免每个 sheet 再解析一次，耗时计入性能剖析)
+    generated, stats = run_full_audit(
+        files, reporter=reporter, workers=sheet_workers, ref_cache=ref_cache,
+        chunk_rows=chunk_rows, profile=profile, lazy_reports=(),
+    )
+
+    month_output = os.path.join(output_dir, summary["month"])
+    os.makedirs(month_output, exist_ok=True)
+    written = []
+    for filename, artifact in generated:
+        if filename and artifact:
+            artifact.write_to(os.path.join(month_output, filename))
+            written.append(filename)
+
+    # 性能剖析：Chrome trace 与结果文件放在一起 (chrome://tracing 或 ui.perfetto.dev 打开)
+    profiler = stats.get("profile")
+    if profiler is not None:
+        with open(os.path.join(month_output, "profile_trace.json"), "w", encoding="utf-8") as fh:
+            fh.write(profiler.to_chrome_trace())
+        summary["profile_trace"] = os.path.abspath(os.path.join(month_output, "profile_trace.json"))
+
+    summary.update(
+        output_dir=os.path.abspath(month_output),
+        files=written,
+        total_errors=int(stats["total_errors"]),
+        field_errors={k: int(v) for k, v in stats.get("field_errors", {}).items()},
+        leaky_count=int(stats["leaky_count"]),
+    )
+
+# =====================================
+# 🧵 多月份并行
+# =====================================
+# 子进程内的只读状态：预读好的参考表快照，进程启动时加载一次
+_worker_state = {}
+
+def _init_month_worker(snapshot_path):
+    with open(snapshot_path, "rb") as fh:
+        _worker_state["ref_cache"] = pickle.load(fh)
+
+def _audit_month_task(month_dir, output_dir, sheet_workers, chunk_rows, profile):
+    reporter = BufferedReporter()
+    summary = audit_month(
+        month_dir, output_dir, reporter, _worker_state["ref_cache"], sheet_workers, chunk_rows, profile
+    )
+    return summary, reporter
+
+def audit_months(month_dirs, output_dir, workers=1, sheet_workers=1, quiet=False, verbose=False,
+                 snapshot_dir=None, chunk_rows=0, profile=AUDIT_PROFILE):
+    """依次或并行审核多个月份，返回与 month_dirs 同序的摘要列表。"""
+    ref_cache = ReferenceCache(ReferenceSnapshotStore(snapshot_dir) if snapshot_dir else None)
+    preload_references(month_dirs, ref_cache, make_reporter("参考文件", quiet, verbose))
+
+    if workers <= 1 or len(month_dirs) <= 1:
+        return [
+            audit_month(d, output_dir, make_reporter(month_name(d), quiet, verbose), ref_cache,
+                        sheet_workers, chunk_rows, profile)
+            for d in month_dirs
+        ]
+
+    summaries = {}
+    with tempfile.TemporaryDirectory(prefix="audit_cli_") as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, "references.pkl")
+        with open(snapshot_path, "wb") as fh:
+            pickle.dump(ref_cache, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(month_dirs)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_month_worker,
+            initargs=(snapshot_path,),
+        ) as pool:
+            futures = {
+                pool.submit(_audit_month_task, d, output_dir, sheet_workers, chunk_rows, profile): i
+                for i, d in enumerate(month_dirs)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                reporter = make_reporter(month_name(month_dirs[i]), quiet, verbose)
+                try:
+                    summary, buffered = future.result()
+                except Exception as e:
+                    # 子进程异常退出等：该月份记为失败，其余月份照常汇总
+                    reporter.error(f"❌ 审核失败 ({describe_error(e)})")
+                    summaries[i] = {
+                        "month": month_name(month_dirs[i]), "input_dir": os.path.abspath(month_dirs[i]),
+                        "error": describe_error(e), "error_type": type(e).__name__,
+                    }
+                    continue
+                buffered.replay(reporter)
+                summaries[i] = summary
+    return [summaries[i] for i in range(len(month_dirs))]
+
+# =====================================
+# 🚀 入口
+# =====================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="批量审核多个月份的项目提成表，每个月份目录需包含 项目提成/放款明细/二次明细/产品台账 4 个 xlsx 文件。"
+    )
+    parser.add_argument("month_dirs", nargs="+", help="月份目录 (可用通配符一次传入多个)")
+    parser.add_argument("-o", "--output", required=True, help="输出目录，每个月份写入同名子目录")
+    parser.add_argument("--workers", type=int, default=1, help="并行审核的月份数 (默认 1)")
+    parser.add_argument("--sheet-workers", type=int, default=1, help="单个月份内并行审核的 sheet 数 (默认 1)")
+    parser.add_argument(
+        "--snapshot-dir", default=REFERENCE_SNAPSHOT_DIR,
+        help="参考快照目录，累积台账只解析新增行 (默认取环境变量 REFERENCE_SNAPSHOT_DIR)",
+    )
+    parser.add_argument(
+        "--chunk-rows", type=int, default=AUDIT_CHUNK_ROWS,
+        help="流式分块审核的块大小 (行)，超大 sheet 时限制内存占用；0 为整表审核 (默认取环境变量 AUDIT_CHUNK_ROWS)",
+    )
+    parser.add_argument(
+        "--profile", default=AUDIT_PROFILE,
+        help="性能剖析：1 开启 (写出各月份的 profile_trace.json)，0 关闭，memory 另统计进程级 Python 内存峰值增量 (默认取环境变量 AUDIT_PROFILE)",
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="只输出错误与最终汇总")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每个字段的检查进度")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    missing = [d for d in args.month_dirs if not os.path.isdir(d)]
+    if missing:
+        print(f"❌ 目录不存在: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    t0 = time.perf_counter()
+    summaries = audit_months(
+        args.month_dirs, args.output,
+        workers=args.workers, sheet_workers=args.sheet_workers,
+        quiet=args.quiet, verbose=args.verbose, snapshot_dir=args.snapshot_dir,
+        chunk_rows=args.chunk_rows, profile=args.profile,
+    )
+    elapsed = time.perf_counter() - t0
+
+    with open(os.path.join(args.output, "summary.json"), "w", encoding="utf-8") as fh:
+        json.dump({"months": summaries, "seconds": round(elapsed, 3)}, fh, ensure_ascii=False, indent=2)
+
+    for s in summaries:
+        if "error" in s:
+            print(f"{s['month']}\t失败\t{s['error']}")
+        else:
+            print(f"{s['month']}\t错误 {s['total_errors']}\t漏填 {s['leaky_count']}\t{s['seconds']:.1f}s")
+    print(f"共 {len(summaries)} 个月份，耗时 {elapsed:.1f} 秒，汇总见 {os.path.join(args.output, 'summary.json')}")
+    return 1 if any("error" in s for s in summaries) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3544 @@
+# =====================================
+# 审核引擎: 人事用“项目提成 & 二次项目 & 平台工 & 独立架构 & 低价值”自动审核
+# (不依赖 Streamlit；界面见 app3.py，消息与进度经 AuditReporter 输出)
+# =====================================
+
+import pandas as pd
+import numpy as np
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+from io import BytesIO
+from pandas.io.parsers import TextParser
+from pandas.tseries.api import guess_datetime_format
+from collections import OrderedDict
+import unicodedata, re
+import time 
+import hashlib, os, pickle, threading, sys, json, shutil, uuid, itertools, operator, contextlib, tracemalloc, atexit
+import datetime as dt
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import tempfile
+
+try:
+    # 可选依赖：安装 python-calamine 后参考文件走更快的 Rust 解析引擎
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    # 可选依赖：安装 pyarrow 后参考快照以 Arrow IPC 文件保存，加载时内存映射；参考表合同键以 Arrow 字符串存储
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+try:
+    # 可选依赖：安装 XlsxWriter 后审核结果文件走更快的流式写出
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    # resource 仅 Unix 可用；Windows 上性能剖析不记录进程 RSS 峰值
+    import resource
+except ImportError:
+    resource = None
+
+# =====================================
+# ⚙️ 缓存配置
+# =====================================
+# 规则集版本 RULESET_VERSION 由规则文件的 version 与内容摘要派生 (见下方 📐 审核规则)，
+# 修改规则后旧缓存自动失效；只改比对逻辑时请递增规则文件中的 version
+# 内存中最多保留的审核结果数 (LRU 淘汰)
+AUDIT_CACHE_MAX_ENTRIES = 8
+# 可选磁盘缓存目录 (设置环境变量 AUDIT_CACHE_DIR 启用)
+AUDIT_CACHE_DIR = os.environ.get("AUDIT_CACHE_DIR")
+AUDIT_CACHE_DISK_MAX_ENTRIES = 64
+
+# 可选参考快照目录 (设置环境变量 REFERENCE_SNAPSHOT_DIR 启用)：放款明细/产品台账等累积台账
+# 不再每次解析 Excel，只在末尾追加行时只读取新增行
+REFERENCE_SNAPSHOT_DIR = os.environ.get("REFERENCE_SNAPSHOT_DIR")
+# 每种参考文件保留的快照数 (按最近使用淘汰)
+REFERENCE_SNAPSHOT_MAX_ENTRIES = 4
+
+INPUT_FILE_KEYWORDS = ["项目提成", "放款明细", "二次明细", "产品台账"]
+
+# 参考文件读取引擎：优先 calamine，未安装时退回 openpyxl read_only 流式读取
+REFERENCE_EXCEL_ENGINE = "calamine" if CalamineWorkbook is not None else "openpyxl"
+# 结果文件写出引擎：优先 xlsxwriter，未安装时退回 openpyxl write_only
+REPORT_EXCEL_ENGINE = "xlsxwriter" if xlsxwriter is not None else "openpyxl"
+
+# 并行审核进程数：大于 1 时各目标 sheet 分发到进程池审核 (环境变量 AUDIT_WORKERS 可覆盖)
+AUDIT_WORKERS = int(os.environ.get("AUDIT_WORKERS", "1"))
+
+# 流式分块审核的块大小 (行)：大于 0 时主表 sheet 按块读入、比对并写出，内存随块大小而非 sheet 大小增长
+# (环境变量 AUDIT_CHUNK_ROWS 可覆盖，默认 0 为整表审核)
+AUDIT_CHUNK_ROWS = int(os.environ.get("AUDIT_CHUNK_ROWS", "0"))
+
+# 性能剖析 (环境变量 AUDIT_PROFILE 可覆盖)：记录各阶段/各规则的墙钟时间、本线程 CPU 时间、行数与进程 RSS 峰值，
+# 开销很小，默认开启；"0" 关闭，"memory" 另用 tracemalloc 统计各阶段的进程级 Python 内存峰值增量 (较慢，排查时用)
+AUDIT_PROFILE = os.environ.get("AUDIT_PROFILE", "1")
+
+# 结果文件落盘目录 (环境变量 AUDIT_ARTIFACT_DIR 可覆盖；未设置时用 AUDIT_CACHE_DIR/artifacts，都未设置时用临时目录)：
+# 结果文件不再以 BytesIO 留在内存与结果缓存中，只保留路径；最多保留最近使用的 AUDIT_ARTIFACT_MAX_RUNS 次审核
+AUDIT_ARTIFACT_DIR = os.environ.get("AUDIT_ARTIFACT_DIR")
+AUDIT_ARTIFACT_MAX_RUNS = int(os.environ.get("AUDIT_ARTIFACT_MAX_RUNS", "32"))
+
+# 按需生成的结果文件 (环境变量 AUDIT_LAZY_REPORTS 可覆盖)：首次下载时才按保存的错误矩阵生成 (需重新解析该 sheet)。
+# "full" 审核标注版按需生成 (默认)，"all" 仅错误行也按需生成，"0" 审核时全部生成；
+# 只适合未必下载全部文件的界面，批量审核 (audit_cli) 与基准测试经 run_full_audit(lazy_reports=()) 审核时全部生成。
+# 设置不为 "0" 时，增量复审中有变化的 sheet 两个文件都按需生成
+AUDIT_LAZY_REPORTS = os.environ.get("AUDIT_LAZY_REPORTS", "full")
+
+# 审核规则文件 (环境变量 AUDIT_RULES_PATH 可覆盖)
+AUDIT_RULES_PATH = os.environ.get("AUDIT_RULES_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "audit_rules.json"
+)
+
+# =====================================
+# 📐 审核规则：规则文件编译为执行计划
+# =====================================
+COMPARE_TYPES = ('text', 'num', 'num_term', 'date')
+
+class AuditRule:
+    """一条比对规则：主表字段与某个参考源的列按 compare 类型比对。"""
+
+    def __init__(self, field, source, column, compare='text', tolerance=0, skip_ref_values=None):
+        if compare not in COMPARE_TYPES:
+            raise ValueError(f"规则 '{field}' 的比对类型 '{compare}' 无效，可选: {', '.join(COMPARE_TYPES)}")
+        self.field = field
+        self.source = source
+        self.column = column
+        self.compare = compare
+        self.tolerance = tolerance
+        # 参考值为空，或去空格、转小写后属于该列表时，该行不比对
+        self.skip_ref_values = None if skip_ref_values is None else list(skip_ref_values)
+
+    @property
+    def ref_col(self):
+        # 与 prepare_one_ref_df 标准化后的参考列名一致
+        return f"ref_{self.source}_{self.column}"
+
+    def signature(self):
+        return self.ref_col, self.compare, self.tolerance, self.skip_ref_values
+
+class RuleSet:
+    """
+    规则文件的编译结果：按字段分组的比对规则、目标 sheet 关键词、各参考源的文件关键词与所需列。
+    version 由规则文件的 version 与内容摘要组成，规则一改缓存即失效。
+    """
+
+    def __init__(self, spec):
+        self.target_sheet_keywords = list(spec.get("target_sheets", []))
+        references = spec.get("references", {})
+        self.reference_files = {source: cfg["file"] for source, cfg in references.items()}
+        self.reference_columns = {source: list(cfg.get("columns", [])) for source, cfg in references.items()}
+
+        self.fields = OrderedDict()  # 字段关键词 -> [AuditRule]
+        for item in spec.get("rules", []):
+            rule = AuditRule(
+                item["field"], item["source"], item["column"], item.get("compare", 'text'),
+                item.get("tolerance", 0), item.get("skip_ref_values"),
+            )
+            if rule.source not in references:
+                raise ValueError(f"规则 '{rule.field}' 的参考源 '{rule.source}' 未在 references 中声明")
+            if rule.column not in self.reference_columns[rule.source]:
+                self.reference_columns[rule.source].append(rule.column)
+            rules = self.fields.setdefault(rule.field, [])
+            # 完全相同的规则结果相同，只保留一条
+            if all(r.signature() != rule.signature() for r in rules):
+                rules.append(rule)
+
+        digest = hashlib.sha256(json.dumps(spec, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+        self.version = f"{spec.get('version', 'v0')}+{digest[:8]}"
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as fh:
+            return cls(json.load(fh))
+
+    def target_sheets(self, sheet_names):
+        return [s for s in sheet_names if any(k in s for k in self.target_sheet_keywords)]
+
+    def plan(self, columns, ref_columns):
+        """按单个 sheet 的列名与参考查找表的列编译执行计划。"""
+        return SheetPlan(self, list(columns), ref_columns)
+
+class SheetPlan:
+    """
+    规则在单个 sheet 上的执行计划：列名只归一化一次，每个字段关键词只解析一次 (与 find_col 相同，取首个包含关键词的列)；
+    主表中找不到列的字段不参与审核，参考列不存在的规则直接丢弃。
+    """
+
+    def __init__(self, ruleset, columns, ref_columns):
+        names = [normalize_colname(c) for c in columns]
+        ref_columns = set(ref_columns)
+        self.total = len(ruleset.fields)
+        self.fields = []  # [(字段在规则集中的序号, 字段, 主表列名, 主表列下标, [AuditRule])]
+        for pos, (field, rules) in enumerate(ruleset.fields.items()):
+            key = field.strip().lower()
+            col_idx = next((i for i, name in enumerate(names) if key in name), None)
+            if col_idx is None:
+                continue
+            self.fields.append(
+                (pos, field, columns[col_idx], col_idx, [r for r in rules if r.ref_col in ref_columns])
+            )
+
+    @property
+    def ref_cols(self):
+        return sorted({r.ref_col for *_, rules in self.fields for r in rules})
+
+AUDIT_RULES = RuleSet.load(AUDIT_RULES_PATH)
+RULESET_VERSION = AUDIT_RULES.version
+
+# =====================================
+# 🧰 工具函数 (不变)
+# =====================================
+
+def find_file(files_list, keyword):
+    for f in files_list:
+        if keyword in f.name:
+            return f
+    raise FileNotFoundError(f"未找到包含关键词「{keyword}」的文件")
+
+def file_digest(f):
+    """计算上传文件内容的 SHA-256 摘要。"""
+    return hashlib.sha256(f.getvalue()).hexdigest()
+
+def audit_cache_key(uploaded_files):
+    """由 4 个输入文件的内容摘要 + 规则集版本组成缓存键。"""
+    parts = [f"ruleset={RULESET_VERSION}"]
+    for kw in INPUT_FILE_KEYWORDS:
+        parts.append(f"{kw}={file_digest(find_file(uploaded_files, kw))}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+def _result_available(result):
+    # 缓存的 (结果文件列表, 统计) 只保存结果文件的路径，文件被清理后该结果不可用
+    files = result[0] if isinstance(result, tuple) else ()
+    return all(data.exists() for _, data in files if isinstance(data, Artifact))
+
+class AuditResultCache:
+    """
+    审核结果缓存：内存 LRU + 可选磁盘层。
+    键为 audit_cache_key() 的摘要，任何输入字节变化都会得到新键。
+    """
+
+    def __init__(self, max_entries=AUDIT_CACHE_MAX_ENTRIES, disk_dir=None,
+                 disk_max_entries=AUDIT_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._mem:
+                if _result_available(self._mem[key]):
+                    self._mem.move_to_end(key)
+                    return self._mem[key]
+                del self._mem[key]  # 结果文件已被 ArtifactStore 清理
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as fh:
+                value = pickle.load(fh)
+            os.utime(path)  # 刷新访问时间，供磁盘层 LRU 使用
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if not _result_available(value):
+            return None
+        self._put_mem(key, value)
+        return value
+
+    def put(self, key, value):
+        self._put_mem(key, value)
+        if self.disk_dir:
+            self._put_disk(key, value)
+
+    def _put_mem(self, key, value):
+        with self._lock:
+            self._mem[key] = value
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _put_disk(self, key, value):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        entries = sorted(
+            (e for e in os.scandir(self.disk_dir) if e.name.endswith(".pkl")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for e in entries[:max(0, len(entries) - self.disk_max_entries)]:
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        if self.disk_dir:
+            for e in os.scandir(self.disk_dir):
+                if e.name.endswith(".pkl"):
+                    try:
+                        os.remove(e.path)
+                    except OSError:
+                        pass
+
+# =====================================
+# 📣 消息与进度输出
+# =====================================
+class AuditReporter:
+    """
+    审核过程中的消息与进度输出接口。引擎只调用这里的方法，不直接依赖 Streamlit；
+    基类丢弃所有输出，界面、子进程各自提供实现。
+    """
+
+    def message(self, level, text):
+        # level: write / info / success / warning / error / caption / subheader
+        pass
+
+    def progress(self, key, fraction):
+        pass
+
+    def status(self, key, text):
+        pass
+
+    def write(self, text):
+        self.message("write", text)
+
+    def info(self, text):
+        self.message("info", text)
+
+    def success(self, text):
+        self.message("success", text)
+
+    def warning(self, text):
+        self.message("warning", text)
+
+    def error(self, text):
+        self.message("error", text)
+
+    def caption(self, text):
+        self.message("caption", text)
+
+    def subheader(self, text):
+        self.message("subheader", text)
+
+    # 性能剖析：run_full_audit 按 AUDIT_PROFILE 设置，未设置时 stage() 为空操作
+    profiler = None
+
+    def stage(self, name, sheet=None, rows=None):
+        """计时阶段 (with reporter.stage(...) as st: ...)，可在阶段内设置 st.rows。"""
+        if self.profiler is None:
+            return contextlib.nullcontext(ProfileStage(name, sheet, rows))
+        return self.profiler.stage(name, sheet, rows)
+
+class BufferedReporter(AuditReporter):
+    """记录全部输出事件，之后在主进程中按原顺序 replay 到真正的 reporter。"""
+
+    def __init__(self):
+        self.events = []
+
+    def message(self, level, text):
+        self.events.append(("message", (level, text)))
+
+    def progress(self, key, fraction):
+        self.events.append(("progress", (key, fraction)))
+
+    def status(self, key, text):
+        self.events.append(("status", (key, text)))
+
+    def replay(self, reporter):
+        for name, args in self.events:
+            getattr(reporter, name)(*args)
+        if self.profiler is not None and reporter.profiler is not None:
+            reporter.profiler.merge(self.profiler)
+
+# =====================================
+# ⏱️ 性能剖析
+# =====================================
+def _process_peak_rss_mb():
+    # 进程启动以来的 RSS 峰值 (ru_maxrss)，不区分阶段与并发的审核任务
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+class ProfileStage:
+    """一个计时阶段；rows 可在阶段内 (数据读出后) 再填写。"""
+
+    def __init__(self, name, sheet=None, rows=None, depth=0):
+        self.name = name
+        self.sheet = sheet
+        self.rows = rows
+        self.depth = depth
+        self.pid = os.getpid()
+        self.tid = threading.get_native_id()
+        self.start = time.time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.process_peak_rss_mb = None
+        self.process_peak_traced_mb = None
+        self._traced_base = 0
+        self._traced_peak = 0
+
+    def as_dict(self):
+        return {
+            "name": self.name, "sheet": self.sheet, "rows": self.rows, "depth": self.depth,
+            "pid": self.pid, "tid": self.tid, "start": self.start,
+            "wall_s": round(self.wall, 6), "thread_cpu_s": round(self.cpu, 6),
+            "process_peak_rss_mb": self.process_peak_rss_mb, "process_peak_traced_mb": self.process_peak_traced_mb,
+        }
+
+# tracemalloc 为进程级：各剖析对象按引用计数共用，最后一个结束时才停止；
+# reset_peak 也作用于整个进程，重新计峰前先把当前峰值记入所有未结束的阶段
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+_traced_stages = []
+
+def _acquire_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+def _release_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+def _enter_traced_stage(rec):
+    with _tracing_lock:
+        current, peak = tracemalloc.get_traced_memory()
+        for other in _traced_stages:
+            other._traced_peak = max(other._traced_peak, peak)
+        tracemalloc.reset_peak()
+        rec._traced_base = rec._traced_peak = current
+        _traced_stages.append(rec)
+
+def _exit_traced_stage(rec):
+    with _tracing_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        for other in _traced_stages:
+            other._traced_peak = max(other._traced_peak, peak)
+        _traced_stages.remove(rec)
+    rec.process_peak_traced_mb = (rec._traced_peak - rec._traced_base) / 2**20
+
+class AuditProfiler:
+    """
+    分阶段性能剖析：每个阶段记录墙钟时间、本线程 CPU 时间、处理行数与进程 RSS 峰值；
+    memory=True 时另记录该阶段内 tracemalloc 的内存峰值相对阶段开始时的增量。
+    RSS 峰值与 tracemalloc 都是进程级的：同一进程中并发的审核任务会计入彼此的内存。
+    子进程中的记录随 BufferedReporter 带回主进程合并，可导出为 JSON 或 Chrome trace。
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        self._tracing = False
+
+    @classmethod
+    def from_setting(cls, setting):
+        """按 AUDIT_PROFILE 的取值创建，关闭时返回 None。"""
+        setting = str(setting).strip().lower()
+        if setting in ("", "0", "off", "false", "no", "none"):
+            return None
+        return cls(memory=setting == "memory")
+
+    @contextlib.contextmanager
+    def stage(self, name, sheet=None, rows=None):
+        if self.memory and not self._tracing:
+            _acquire_tracing()
+            self._tracing = True
+        rec = ProfileStage(name, sheet, rows, depth=len(self._stack))
+        if self.memory:
+            _enter_traced_stage(rec)
+        self._stack.append(rec)
+        # 阶段在同一线程内执行：用线程 CPU 时间，不混入并发任务的 CPU
+        t0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield rec
+        finally:
+            rec.wall = time.perf_counter() - t0
+            rec.cpu = time.thread_time() - c0
+            rec.process_peak_rss_mb = _process_peak_rss_mb()
+            self._stack.pop()
+            if self.memory:
+                _exit_traced_stage(rec)
+            self.records.append(rec)
+
+    def finish(self):
+        """释放本对象对 tracemalloc 的引用 (进程内最后一个使用者结束时停止)。"""
+        if self._tracing:
+            _release_tracing()
+            self._tracing = False
+
+    def merge(self, other):
+        # 子进程的记录挂在当前打开的阶段之下
+        for r in other.records:
+            r.depth += len(self._stack)
+            self.records.append(r)
+
+    def _ordered(self):
+        return sorted(self.records, key=lambda r: (r.start, r.depth))
+
+    def summary_frame(self):
+        """按 (sheet, 阶段) 汇总 (同名阶段如分块比对累加)，按首次出现的顺序排列。"""
+        rows = OrderedDict()
+        for r in self._ordered():
+            key = (r.sheet or "", r.name)
+            if key not in rows:
+                rows[key] = {"sheet": key[0], "阶段": "　" * r.depth + r.name, "次数": 0,
+                             "墙钟(秒)": 0.0, "线程CPU(秒)": 0.0, "行数": None,
+                             "进程RSS峰值(MB)": None, "进程Python内存峰值增量(MB)": None}
+            row = rows[key]
+            row["次数"] += 1
+            row["墙钟(秒)"] += r.wall
+            row["线程CPU(秒)"] += r.cpu
+            if r.rows is not None:
+                row["行数"] = (row["行数"] or 0) + r.rows
+            for col, v in (("进程RSS峰值(MB)", r.process_peak_rss_mb),
+                           ("进程Python内存峰值增量(MB)", r.process_peak_traced_mb)):
+                if v is not None:
+                    row[col] = v if row[col] is None else max(row[col], v)
+        df = pd.DataFrame(list(rows.values()), columns=[
+            "sheet", "阶段", "次数", "墙钟(秒)", "线程CPU(秒)", "行数", "进程RSS峰值(MB)", "进程Python内存峰值增量(MB)",
+        ])
+        df["行数"] = df["行数"].astype("Int64")
+        if not self.memory:
+            df = df.drop(columns=["进程Python内存峰值增量(MB)"])
+        return df.round(4)
+
+    def to_json(self):
+        return json.dumps(
+            {"memory": self.memory, "stages": [r.as_dict() for r in self._ordered()]},
+            ensure_ascii=False, indent=2,
+        )
+
+    def to_chrome_trace(self):
+        """Chrome trace 格式 (chrome://tracing 或 ui.perfetto.dev 打开)。"""
+        records = self._ordered()
+        t0 = records[0].start if records else 0.0
+        events = [
+            {"name": "process_name", "ph": "M", "pid": pid,
+             "args": {"name": "主进程" if pid == os.getpid() else f"子进程 {pid}"}}
+            for pid in dict.fromkeys(r.pid for r in records)
+        ]
+        for r in records:
+            args = {k: v for k, v in r.as_dict().items()
+                    if k in ("sheet", "rows", "thread_cpu_s", "process_peak_rss_mb", "process_peak_traced_mb")
+                    and v is not None}
+            events.append({
+                "name": r.name, "cat": r.sheet or "audit", "ph": "X",
+                "ts": round((r.start - t0) * 1e6), "dur": round(r.wall * 1e6),
+                "pid": r.pid, "tid": r.tid, "args": args,
+            })
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False)
+
+def normalize_colname(c):
+    return str(c).strip().lower()
+
+def find_col(df, keyword, exact=False):
+    if df is None:
+        return None
+    key = keyword.strip().lower()
+    for col in df.columns:
+        cname = normalize_colname(col)
+        if (exact and cname == key) or (not exact and key in cname):
+            return col
+    return None
+
+def normalize_num(val):
+    if pd.isna(val):
+        return None
+    s = str(val).replace(",", "").strip()
+    if s in ["", "-", "nan"]:
+        return None
+    try:
+        if "%" in s:
+            s = s.replace("%", "")
+            return float(s) / 100
+        return float(s)
+    except:
+        return s
+
+def normalize_text(val):
+    if pd.isna(val):
+        return ""
+    s = str(val)
+    s = re.sub(r'[\n\r\t ]+', '', s)
+    s = s.replace('\u3000', '')
+    s = ''.join(unicodedata.normalize('NFKC', ch) for ch in s)
+    return s.lower().strip()
+
+# --- 向量化版本：与上面的逐元素函数结果一致，用于整列比对 ---
+
+def _str_values(series):
+    # 与逐元素 str(val) 一致 (非 object 列先转 object，避免 datetime64 等格式差异)
+    if series.dtype != object:
+        series = series.astype(object)
+    return series.astype(str)
+
+def _try_float(s):
+    try:
+        return float(s)
+    except (TypeError, ValueError):
+        return None
+
+def _str_element_mask(series):
+    # object 列中哪些元素是 str；逐元素 isinstance 比 .str.len() 快得多 (后者对非字符串元素逐个走异常分支)
+    if series.dtype == object:
+        values = series.to_numpy()
+        return np.fromiter(map(isinstance, values, itertools.repeat(str, len(values))), dtype=bool, count=len(values))
+    try:
+        return series.str.len().notna().to_numpy()
+    except AttributeError:
+        return np.zeros(len(series), dtype=bool)
+
+def na_like_vec(series):
+    """等价于 pd.isna(s) | s.astype(str).str.strip().isin(["", "nan", "None"])。"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # 只判断各类别，按类别编码展开 (编码 -1 为缺失)
+        hit = np.append(na_like_vec(pd.Series(series.cat.categories, dtype=object)).to_numpy(), True)
+        return pd.Series(hit[series.cat.codes.to_numpy()], index=series.index)
+    na = series.isna().to_numpy()
+    if series.dtype == object:
+        is_str = _str_element_mask(series)
+        if is_str.any():
+            codes, uniques = pd.factorize(series[is_str])
+            hit = pd.Series(uniques, dtype=object).str.strip().isin(["", "nan", "None"])
+            na[is_str] |= hit.to_numpy()[codes]
+    return pd.Series(na, index=series.index)
+
+def _parse_num_strings(text):
+    """
+    对 str 数组执行 normalize_num 的字符串分支。
+    返回 (values, is_num, is_str)：is_str 表示结果为字符串 (既非数值也非 None)。
+    """
+    n = len(text)
+    values = np.full(n, np.nan)
+    is_num = np.zeros(n, dtype=bool)
+    if n == 0:
+        return values, is_num, is_num.copy()
+    text = pd.Series(text, dtype=object).str.replace(",", "", regex=False).str.strip()
+    candidate = ~text.isin(["", "-", "nan"]).to_numpy()
+    has_pct = text.str.contains("%", regex=False).to_numpy()
+    text = text.where(~has_pct, text.str.replace("%", "", regex=False))
+
+    cand_pos = np.flatnonzero(candidate)
+    if len(cand_pos):
+        cand_text = text.to_numpy(dtype=object)[cand_pos]
+        # pd.to_numeric 快速筛出可解析项，再用 float() 语义 (numpy 对象转 float) 取精确值
+        parsed = pd.to_numeric(pd.Series(cand_text), errors="coerce").notna().to_numpy()
+        try:
+            values[cand_pos[parsed]] = cand_text[parsed].astype(float)
+            is_num[cand_pos[parsed]] = True
+        except (TypeError, ValueError):
+            parsed[:] = False
+        # 其余 (如 "NaN"、全角数字、下划线分组、溢出) 按唯一值逐个走 float()
+        slow_pos = cand_pos[~parsed]
+        if len(slow_pos):
+            slow_text = cand_text[~parsed]
+            lookup = {u: _try_float(u) for u in pd.unique(slow_text)}
+            slow_vals = np.array([lookup[u] for u in slow_text], dtype=object)
+            slow_ok = np.array([v is not None for v in slow_vals], dtype=bool)
+            values[slow_pos[slow_ok]] = slow_vals[slow_ok].astype(float)
+            is_num[slow_pos[slow_ok]] = True
+    values[has_pct & is_num] /= 100
+    return values, is_num, candidate & ~is_num
+
+def _num_parts(series):
+    """
+    逐元素的 normalize_num 结果：返回 (values, is_num, is_str) 三个 numpy 数组，
+    is_str 表示结果为字符串 (既非数值也非 None)。
+    """
+    n = len(series)
+    na = series.isna().to_numpy()
+    values = np.full(n, np.nan)
+    is_num = np.zeros(n, dtype=bool)
+    is_str = np.zeros(n, dtype=bool)
+
+    if pd.api.types.is_bool_dtype(series.dtype) or (
+            series.dtype != object and not pd.api.types.is_numeric_dtype(series.dtype)):
+        # bool / datetime 等转成字符串后都无法解析为数值
+        is_str = ~na
+    elif pd.api.types.is_numeric_dtype(series.dtype):
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        is_num = ~na
+    else:
+        str_mask = _str_element_mask(series)
+        other_mask = ~na & ~str_mask
+        if other_mask.any():
+            others = series[other_mask]
+            if pd.api.types.infer_dtype(others, skipna=True) in (
+                    "integer", "floating", "mixed-integer-float", "decimal"):
+                # 纯数值元素：float(str(x)) == float(x)，无需转字符串
+                values[other_mask] = pd.to_numeric(others).to_numpy(dtype=float)
+                is_num[other_mask] = True
+            else:
+                # 含 bool / 日期等，按 str(x) 走字符串分支
+                str_mask = str_mask | other_mask
+        if str_mask.any():
+            text = _str_values(series[str_mask]).to_numpy(dtype=object)
+            v, num, s_ = _parse_num_strings(text)
+            values[str_mask] = v
+            is_num[str_mask] = num
+            is_str[str_mask] = s_
+    return values, is_num, is_str
+
+def _num_upcast_flag(is_num, is_str):
+    # Series.apply 的类型推断：结果中只有数值与 None 时整列转为 float64，
+    # None 变成 NaN，也算作数值
+    return bool(is_num.any() and not is_str.any())
+
+def _apply_num_upcast(is_num, is_str, upcast=None):
+    # upcast 为 None 时按传入的行推断；增量复审只比对部分行，由调用方给定整列的推断结果
+    if upcast is None:
+        upcast = _num_upcast_flag(is_num, is_str)
+    if upcast:
+        return np.ones(len(is_num), dtype=bool)
+    return is_num
+
+@lru_cache(maxsize=1)
+def _nfkc_char_table():
+    # 逐字符 NFKC 映射表 (normalize_text 按字符而非整串做 NFKC)
+    table = {}
+    for cp in range(sys.maxunicode + 1):
+        if 0xD800 <= cp <= 0xDFFF:
+            continue
+        ch = chr(cp)
+        norm = unicodedata.normalize('NFKC', ch)
+        if norm != ch:
+            table[cp] = norm
+    return table
+
+def normalize_text_codes(series):
+    """
+    normalize_text 结果的整数编码形式：返回 (codes, vocab)，vocab[codes] 与 series.apply(normalize_text) 一致。
+    vocab 为互不相同的归一化文本，vocab[0] 固定为 "" (空值)；category 列只归一化各类别。
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # 类别只含 str / int (见 compact_frame)，逐个 str() 与 object 列的结果相同
+        raw_codes = series.cat.codes.to_numpy().astype(np.intp)
+        text = _str_values(pd.Series(series.cat.categories, dtype=object))
+    else:
+        na = series.isna().to_numpy()
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty"):
+            text = series
+        else:
+            # 非纯字符串列先转成 str，避免 1 / 1.0 / True 在去重时被视为同一值
+            text = _str_values(series)
+        raw_codes, uniques = pd.factorize(text)
+        raw_codes[na] = -1
+        text = pd.Series(uniques, dtype=object)
+    norm = text.str.replace(r'[\n\r\t ]+', '', regex=True)
+    norm = norm.str.replace('\u3000', '', regex=False)
+    norm = norm.str.translate(_nfkc_char_table())
+    norm = norm.str.lower().str.strip()
+    # 归一化后相同的文本合并为同一编码；空值 (原编码 -1) 对应 vocab[0] = ""
+    lut, vocab = pd.factorize(np.concatenate([np.array([""], dtype=object), norm.to_numpy(dtype=object)]))
+    return lut[raw_codes + 1], np.asarray(vocab, dtype=object)
+
+def detect_header_row(store, sheet_name):
+    # (注意: 直接基于 WorkbookStore 中已解析的前两行判断，不再重复读取文件)
+    preview = store.preview(sheet_name)
+    first_row = preview.iloc[0]
+    total_cells = len(first_row)
+    empty_like = sum(
+        (pd.isna(x) or str(x).startswith("Unnamed") or str(x).strip() == "")
+        for x in first_row
+    )
+    empty_ratio = empty_like / total_cells if total_cells > 0 else 0
+    return 1 if empty_ratio >= 0.7 else 0
+
+def get_header_row(store, sheet_name):
+    if any(k in sheet_name for k in ["起租", "二次"]):
+        return 1
+    return detect_header_row(store, sheet_name)
+
+class WorkbookStore:
+    """
+    单次审核内的工作簿存储：每个上传文件只打开一次，每个 sheet 只解析一次。
+    表头检测与 DataFrame 构建共用同一份已解析的原始单元格网格。
+    参考文件可通过 read_column_rows() 只读取所需列。
+    """
+
+    def __init__(self, file, engine="openpyxl"):
+        self.name = getattr(file, "name", str(file))
+        self.engine = engine
+        self._data = _read_file_bytes(file)
+        self._book_obj = None
+        self._grids = {}    # sheet -> 原始单元格网格 (list of rows)
+        self._heads = {}    # sheet -> 文件前几行 (表头检测用)
+        self._frames = {}   # (sheet, header) -> DataFrame
+        self.parse_counts = {}
+        self.parse_seconds = {}
+
+    def _book(self):
+        if self._book_obj is None:
+            if self.engine == "calamine":
+                self._book_obj = CalamineWorkbook.from_filelike(BytesIO(self._data))
+            else:
+                self._book_obj = load_workbook(
+                    BytesIO(self._data), read_only=True, data_only=True, keep_links=False
+                )
+        return self._book_obj
+
+    @property
+    def sheet_names(self):
+        book = self._book()
+        return list(book.sheet_names if self.engine == "calamine" else book.sheetnames)
+
+    def _count_parse(self, sheet_name, t0):
+        self.parse_counts[sheet_name] = self.parse_counts.get(sheet_name, 0) + 1
+        self.parse_seconds[sheet_name] = (
+            self.parse_seconds.get(sheet_name, 0) + time.perf_counter() - t0
+        )
+
+    def _grid(self, sheet_name):
+        if sheet_name not in self._grids:
+            t0 = time.perf_counter()
+            grid = _SheetRowReader(self._book(), self.engine, sheet_name).read_grid()
+            self._grids[sheet_name] = grid
+            # read_excel(nrows=2, header=None) 实际读取文件前 3 行
+            self._heads[sheet_name] = [
+                _trim_trailing_empty(list(row)) for row in grid[:3]
+            ]
+            self._count_parse(sheet_name, t0)
+        return self._grids[sheet_name]
+
+    def preview(self, sheet_name):
+        """等价于 read_excel(nrows=2, header=None)。"""
+        if sheet_name not in self._heads:
+            # 只读取前几行，不解析整表
+            reader = _SheetRowReader(self._book(), self.engine, sheet_name)
+            self._heads[sheet_name] = list(itertools.islice(reader.iter_cells(), 3))
+        rows = self._heads[sheet_name]
+        while rows and not rows[-1]:
+            rows = rows[:-1]
+        if not rows:
+            return pd.DataFrame()
+        width = max(len(r) for r in rows)
+        rows = [r + [""] * (width - len(r)) for r in rows]
+        return TextParser(rows, header=None, nrows=2, skip_blank_lines=False).read(nrows=2)
+
+    def frame(self, sheet_name, header=0):
+        """等价于 read_excel(sheet_name=..., header=header)，结果按 (sheet, header) 复用。"""
+        key = (sheet_name, header)
+        if key not in self._frames:
+            grid = self._grid(sheet_name)
+            if grid:
+                df = TextParser(grid, header=header, skip_blank_lines=False).read()
+            else:
+                df = pd.DataFrame()
+            self._frames[key] = df
+            # DataFrame 已建成，释放原始网格 (表头检测所需的前两行另存)
+            self._grids.pop(sheet_name, None)
+        return self._frames[key]
+
+    def chunked(self, sheet_name, header, chunk_rows, spill_dir):
+        """
+        按块读取 sheet (不构建整表网格与 DataFrame)，各块暂存在 spill_dir 下，返回 _ChunkedSheet；
+        没有数据行或列类型无法逐块还原时返回 None。
+        """
+        t0 = time.perf_counter()
+        reader = _SheetRowReader(self._book(), self.engine, sheet_name)
+        sheet = _ChunkedSheet(reader.iter_cells(), header, chunk_rows, spill_dir)
+        self._count_parse(sheet_name, t0)
+        if sheet.n_rows == 0 or sheet.dtypes is None:
+            return None
+        return sheet
+
+    def read_column_rows(self, sheet_names, keywords):
+        """
+        只读取关键字命中的列 (等价于对 read_excel(header=0) 拼接后的结果执行 find_col 再取列，
+        但不会为其余列转换单元格)，返回 {"wanted": 列名, "sheets": [{"name", "columns", "rows", "digest"}, ...]}，
+        rows 为已转换的单元格行 (首行为表头，尾部空行已去除)，digest 为末行之前各行的指纹 (见 _RowDigest)。
+        """
+        t0 = time.perf_counter()
+        readers = [_SheetRowReader(self._book(), self.engine, s) for s in sheet_names]
+        # 1. 先读各 sheet 表头，按拼接后的列顺序解析关键字
+        wanted = _wanted_columns(readers, keywords)
+
+        # 2. 再只转换所需列的单元格
+        sheets = []
+        for name, reader in zip(sheet_names, readers):
+            digest = _RowDigest(reader)
+            rows = reader.read_rows(wanted, digest=digest)
+            sheets.append({"name": name, "columns": reader.names(wanted), "rows": rows, "digest": digest.hexdigest()})
+            self._count_parse(name, t0)
+            t0 = time.perf_counter()
+        return {"wanted": wanted, "sheets": sheets}
+
+    def read_appended_rows(self, sheet_names, keywords, tails):
+        """
+        tails 为同一来源上一次读取结果的 column_tails。列解析结果相同、且各 sheet 表头、原末行与
+        末行之前各行的指纹都未变 (只在末尾追加了行) 时，只转换新增行，返回与 read_column_rows 结构相同的结果
+        (rows 为表头 + 新增行，digest 为新末行之前各行的指纹)；否则返回 None (需整表重读)。
+        原有行只计算指纹、不转换。
+        """
+        t0 = time.perf_counter()
+        if [sheet["name"] for sheet in tails["sheets"]] != list(sheet_names):
+            return None
+        readers = [_SheetRowReader(self._book(), self.engine, s) for s in sheet_names]
+        wanted = _wanted_columns(readers, keywords)
+        if wanted != tails["wanted"]:
+            return None
+
+        sheets = []
+        for name, reader, old in zip(sheet_names, readers, tails["sheets"]):
+            if old["rows"] == 0 or reader.names(wanted) != old["columns"]:
+                return None
+            digest = _RowDigest(reader)
+            rows = reader.read_rows(wanted, start=old["rows"], digest=digest)
+            if (len(rows) < 2 or rows[0] != old["header"] or rows[1] != old["last"]
+                    or digest.skipped != old["digest"]):
+                return None
+            sheets.append({
+                "name": name, "columns": old["columns"], "rows": rows[:1] + rows[2:], "digest": digest.hexdigest(),
+            })
+            self._count_parse(name, t0)
+            t0 = time.perf_counter()
+        return {"wanted": wanted, "sheets": sheets}
+
+def _wanted_columns(readers, keywords):
+    # 按各 sheet 表头拼接后的列顺序解析关键字 (与对拼接后的 DataFrame 执行 find_col 相同)
+    union_cols = list(dict.fromkeys(c for r in readers for c in r.columns))
+    header_df = pd.DataFrame(columns=union_cols)
+    wanted = []
+    for kw in keywords:
+        col = find_col(header_df, kw)
+        if col is not None and col not in wanted:
+            wanted.append(col)
+    wanted.sort(key=union_cols.index)
+    return wanted
+
+def column_tails(column_rows, previous=None):
+    """
+    各 sheet 的表头、末行、末行之前各行的指纹与数据行数 (供下次 read_appended_rows 判断是否只追加了行)。
+    previous 给出时 column_rows 为 read_appended_rows 的结果，行数在上次的基础上累加。
+    """
+    sheets = []
+    for i, sheet in enumerate(column_rows["sheets"]):
+        rows = sheet["rows"]
+        old = previous["sheets"][i] if previous is not None else {"rows": 0, "last": None, "digest": None}
+        new_rows = max(len(rows) - 1, 0)
+        sheets.append({
+            "name": sheet["name"],
+            "columns": sheet["columns"],
+            "header": rows[0] if rows else None,
+            "last": rows[-1] if new_rows else old["last"],
+            "digest": sheet["digest"] if new_rows else old["digest"],
+            "rows": old["rows"] + new_rows,
+        })
+    return {"wanted": column_rows["wanted"], "sheets": sheets}
+
+class _RowDigest:
+    """
+    所需列原始单元格 (未转换) 的逐行指纹，用于确认快照之后原有行未被修改。
+    行按批计入 (批次边界只取决于计入的行序列)，相同的行序列得到相同的指纹。
+    """
+
+    BATCH_ROWS = 4096
+
+    def __init__(self, reader):
+        self.skipped = None
+        self._raw = reader.engine == "calamine"  # calamine 行即单元格值，openpyxl 行为单元格对象
+        self._hash = hashlib.sha256()
+        self._batch = []
+        self.positions = []
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @positions.setter
+    def positions(self, positions):
+        self._positions = positions
+        self._width = max(positions) + 1 if positions else 0
+        self._pick = operator.itemgetter(*positions) if len(positions) > 1 else None
+
+    def add(self, row):
+        if self._raw and self._pick is not None and len(row) >= self._width:
+            values = self._pick(row)
+        else:
+            width = len(row)
+            values = tuple(
+                (row[i] if self._raw else row[i].value) if i < width else None for i in self._positions
+            )
+        self._batch.append(values)
+        if len(self._batch) >= self.BATCH_ROWS:
+            self._hash.update(repr(self._batch).encode())
+            self._batch = []
+
+    def hexdigest(self):
+        h = self._hash.copy()
+        if self._batch:
+            h.update(repr(self._batch).encode())
+        return h.hexdigest()
+
+class _SheetRowReader:
+    """
+    流式逐行读取单个 sheet：calamine 或 openpyxl read_only。
+    单元格转换与 pandas 对应引擎保持一致。
+    """
+
+    def __init__(self, book, engine, sheet_name):
+        self.engine = engine
+        if engine == "calamine":
+            sheet = book.get_sheet_by_name(sheet_name)
+            start = sheet.start or (0, 0)
+            self._lead_rows, self._lead_cols = start
+            self._rows = sheet.iter_rows()
+            self._convert = _convert_calamine_cell
+        else:
+            sheet = book[sheet_name]
+            sheet.reset_dimensions()
+            self._lead_rows, self._lead_cols = 0, 0
+            self._rows = (list(row) for row in sheet.rows)
+            self._convert = _convert_openpyxl_cell
+        self._header = self._next_row()
+        if self._header is None:
+            self.columns = []
+        else:
+            cells = _trim_trailing_empty([self._convert(c) for c in self._header])
+            self.columns = list(
+                TextParser([cells], header=0, skip_blank_lines=False).read().columns
+            ) if cells else []
+
+    def _next_row(self):
+        if self._lead_rows > 0:
+            self._lead_rows -= 1
+            return []
+        row = next(self._rows, None)
+        if row is not None and self._lead_cols:
+            row = [None] * self._lead_cols + list(row)
+        return row
+
+    def _skip_rows(self, n, digest=None):
+        # 跳过 n 行 (不转换)，返回实际跳过的行数；给出 digest 时逐行计入指纹
+        if digest is None:
+            lead = min(n, self._lead_rows)
+            self._lead_rows -= lead
+            return lead + sum(1 for _ in itertools.islice(self._rows, n - lead))
+        skipped = 0
+        while skipped < n:
+            row = self._next_row()
+            if row is None:
+                break
+            digest.add(row)
+            skipped += 1
+        return skipped
+
+    def _is_empty(self, cell):
+        value = cell if self.engine == "calamine" else cell.value
+        return value is None or (isinstance(value, str) and value == "")
+
+    def iter_cells(self):
+        """逐行产出已转换、去掉行尾空单元格的单元格列表 (read_grid 补齐宽度前的行)。"""
+        if self._header is None:
+            return
+        convert = self._convert
+        row = self._header
+        while row is not None:
+            yield _trim_trailing_empty([convert(c) for c in row])
+            row = self._next_row()
+
+    def read_grid(self):
+        """读取全部单元格，结果与 pandas 对应引擎的 get_sheet_data 相同。"""
+        data = []
+        last_with_data = -1
+        for cells in self.iter_cells():
+            if cells:
+                last_with_data = len(data)
+            data.append(cells)
+        data = data[: last_with_data + 1]
+        if data:
+            width = max(len(r) for r in data)
+            data = [r + [""] * (width - len(r)) for r in data]
+        return data
+
+    def names(self, wanted_cols):
+        return [c for c in wanted_cols if c in self.columns]
+
+    def read_rows(self, wanted_cols, start=1, digest=None):
+        """
+        只转换 wanted_cols 对应的单元格，返回行列表：首行为表头，其后为第 start 行起的数据
+        (表头为第 0 行)，尾部空行已去除。start 之前的行只遍历、不转换。
+        给出 digest (_RowDigest) 时，start 之前的行计入指纹后记下 digest.skipped，
+        最终指纹覆盖末个数据行之前的全部行。
+        """
+        if self._header is None:
+            return []
+        positions = [self.columns.index(c) for c in self.names(wanted_cols)]
+        if digest is not None:
+            digest.positions = positions
+        convert = self._convert
+        is_empty = self._is_empty
+        rows = [[convert(self._header[i]) for i in positions]]
+        last_with_data = 0 if not all(is_empty(c) for c in self._header) else -1
+        if self._skip_rows(start - 1, digest) < start - 1:
+            return rows[: last_with_data + 1]
+        if digest is not None:
+            digest.skipped = digest.hexdigest()
+        pending = []  # 上一个数据行及其后的空行：出现下一个数据行时才计入指纹
+        while True:
+            row = self._next_row()
+            if row is None:
+                break
+            width = len(row)
+            rows.append([convert(row[i]) if i < width else "" for i in positions])
+            if not all(is_empty(c) for c in row):
+                last_with_data = len(rows) - 1
+                if digest is not None:
+                    for r in pending:
+                        digest.add(r)
+                    pending = []
+            if digest is not None:
+                pending.append(row)
+        return rows[: last_with_data + 1]
+
+def _sheet_rows_frame(names, rows):
+    if not rows:
+        return pd.DataFrame()
+    if not names:
+        return pd.DataFrame(index=pd.RangeIndex(len(rows) - 1))
+    df = TextParser(rows, header=0, skip_blank_lines=False).read()
+    df.columns = names
+    return df
+
+def column_sheet_frames(column_rows):
+    """read_column_rows 结果中各 sheet 的 DataFrame。"""
+    return [_sheet_rows_frame(s["columns"], s["rows"]) for s in column_rows["sheets"]]
+
+def concat_sheet_frames(frames, wanted):
+    if not frames:
+        return pd.DataFrame(columns=wanted)
+    return pd.concat(frames, ignore_index=True)
+
+def _bool_int_reps(series):
+    # object 列中 True / False (含与之相等的 1 / 0) 先出现的取值，续接新增行时交给 _unify_bool_ints
+    reps = {}
+    for key in (True, False):
+        mask = series.isin([key]).to_numpy()
+        if mask.any():
+            reps[key] = series[mask].iloc[0]
+    return reps
+
+def append_sheet_frame(old_df, rows):
+    """
+    old_df 为某 sheet 已解析的数据，rows 为其后新增的单元格行 (首行为表头)。
+    两段按 _ChunkedSheet 的规则合并各列类型，结果与整表一次解析相同；
+    列类型无法确定、或 old_df 的列需改按 object 重新解析时返回 None。
+    """
+    tail_df = TextParser(rows, header=0, skip_blank_lines=False).read()
+    if tail_df.shape[1] != old_df.shape[1]:
+        return None
+    dtypes = []
+    for j in range(old_df.shape[1]):
+        parts = (old_df.iloc[:, j], tail_df.iloc[:, j])
+        dtype = _resolve_column_dtype({s.dtype for s in parts if not s.isna().all()},
+                                      any(s.isna().any() for s in parts))
+        if dtype is None or (dtype == object and parts[0].dtype != object):
+            return None
+        dtypes.append(dtype)
+
+    # object 列按 object 重新解析新增行 (同 _ChunkedSheet.frames)
+    object_cols = {tail_df.columns[j]: object for j, d in enumerate(dtypes) if d == object}
+    if object_cols:
+        tail_df = TextParser(rows, header=0, skip_blank_lines=False, dtype=object_cols).read()
+    old_cols, tail_cols = {}, {}
+    for j, dtype in enumerate(dtypes):
+        old_s, tail_s = old_df.iloc[:, j], tail_df.iloc[:, j]
+        if dtype == object:
+            tail_cols[j] = _unify_bool_ints(tail_s, _bool_int_reps(old_s))
+            continue
+        if old_s.dtype != dtype:
+            old_cols[j] = old_s.astype(dtype)
+        if tail_s.dtype != dtype:
+            tail_cols[j] = tail_s.astype(dtype)
+    tail_df = pd.DataFrame({j: tail_cols.get(j, tail_df.iloc[:, j]) for j in range(len(dtypes))})
+    tail_df.columns = old_df.columns
+    if old_cols:
+        old_df = pd.DataFrame({j: old_cols.get(j, old_df.iloc[:, j]) for j in range(len(dtypes))},
+                              index=old_df.index)
+        old_df.columns = tail_df.columns
+    return pd.concat([old_df, tail_df], ignore_index=True)
+
+def _resolve_column_dtype(dtypes, has_na):
+    """
+    由各块推断出的类型 (不含全空块) 与是否存在空值，得到整列一次解析时 TextParser 推断的类型；
+    无法确定时返回 None。
+    """
+    kinds = {d.kind for d in dtypes}
+    if not kinds <= set("OfibmM"):
+        return None
+    if "O" in kinds:
+        return np.dtype(object)
+    for kind in ("M", "m"):
+        if kind in kinds:
+            if kinds != {kind}:
+                return np.dtype(object)
+            return next(iter(dtypes)) if len(dtypes) == 1 else None
+    if not kinds or "f" in kinds or has_na:
+        return np.dtype("float64")
+    if "i" in kinds:
+        return np.dtype("int64")
+    return np.dtype(bool)
+
+def _unify_bool_ints(series, reps):
+    """
+    整表解析 object 列时，1 / True、0 / False 统一为该列中先出现的那个取值；
+    逐块解析时 reps 记下各列已出现的取值，跨块沿用。
+    """
+    values = None
+    for key in (True, False):
+        mask = series.isin([key]).to_numpy()
+        if not mask.any():
+            continue
+        rep = reps.setdefault(key, series[mask].iloc[0])
+        if values is None:
+            values = series.to_numpy(dtype=object).copy()
+        values[mask] = rep
+    if values is None:
+        return series
+    return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
+def _iter_pickles(path):
+    with open(path, "rb") as fh:
+        while True:
+            try:
+                yield pickle.load(fh)
+            except EOFError:
+                return
+
+class _ChunkedSheet:
+    """
+    按块读取的单个 sheet (流式审核用)：首遍逐行转换单元格，按块写入临时文件并记下每块各列推断出的类型；
+    之后按块读回，按整列的类型解析，逐块结果与 WorkbookStore.frame() 整表解析的对应行相同。
+    """
+
+    def __init__(self, cell_rows, header, chunk_rows, spill_dir):
+        self.chunk_rows = chunk_rows
+        self.n_rows = 0
+        self.n_chunks = 0
+        self.dtypes = None
+        self._raw_path = os.path.join(spill_dir, "raw.pkl")
+        self._frames_path = os.path.join(spill_dir, "frames.pkl")
+        self._chunk_dtypes = {}  # 列下标 -> 非全空块推断出的类型集合
+        self._has_na = set()     # 含空值的列下标
+
+        lead = list(itertools.islice(cell_rows, header + 1))
+        if len(lead) < header + 1:
+            return
+        self.header_cells = lead[-1]
+        self.width = max(len(r) for r in lead)
+        self._stat_width = self.width
+
+        chunk = []
+        pending_blank = 0
+        with open(self._raw_path, "wb") as fh:
+            for cells in cell_rows:
+                if not cells:
+                    # 末尾的空行与整表解析一样丢弃，之后还有数据行时再补回
+                    pending_blank += 1
+                    continue
+                self.width = max(self.width, len(cells))
+                chunk.extend([] for _ in range(pending_blank))
+                pending_blank = 0
+                chunk.append(cells)
+                if len(chunk) >= chunk_rows:
+                    self._spill(chunk, fh)
+                    chunk = []
+            if chunk:
+                self._spill(chunk, fh)
+
+        self.columns = self._parse([], self.width).columns
+        dtypes = [
+            _resolve_column_dtype(self._chunk_dtypes.get(j, set()), j in self._has_na)
+            for j in range(len(self.columns))
+        ]
+        if all(d is not None for d in dtypes):
+            self.dtypes = dtypes
+
+    def _parse(self, chunk, width, dtype=None):
+        header = self.header_cells + [""] * (width - len(self.header_cells))
+        rows = [header] + [r + [""] * (width - len(r)) for r in chunk]
+        return TextParser(rows, header=0, skip_blank_lines=False, dtype=dtype).read()
+
+    def _spill(self, chunk, fh):
+        df = self._parse(chunk, self.width)
+        for j in range(df.shape[1]):
+            s = df.iloc[:, j]
+            if s.isna().all():
+                self._has_na.add(j)
+            else:
+                self._chunk_dtypes.setdefault(j, set()).add(s.dtype)
+        # 本块才出现的列：之前各块的这些列都为空
+        if self.n_rows:
+            self._has_na.update(range(self._stat_width, self.width))
+        self._stat_width = self.width
+        pickle.dump(chunk, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        self.n_rows += len(chunk)
+        self.n_chunks += 1
+
+    def frames(self):
+        """按块产出解析好的 DataFrame (index 为整表中的行号)。首次读回时解析并另存，之后直接读取。"""
+        if os.path.exists(self._frames_path):
+            yield from _iter_pickles(self._frames_path)
+            return
+        object_cols = {c: object for c, d in zip(self.columns, self.dtypes) if d == object}
+        reps = {c: {} for c in object_cols}
+        start = 0
+        tmp_path = self._frames_path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            for chunk in _iter_pickles(self._raw_path):
+                df = self._parse(chunk, self.width, dtype=object_cols or None)
+                for col, dtype in zip(self.columns, self.dtypes):
+                    if col in object_cols:
+                        df[col] = _unify_bool_ints(df[col], reps[col])
+                    elif df[col].dtype != dtype:
+                        df[col] = df[col].astype(dtype)
+                df.index = pd.RangeIndex(start, start + len(df))
+                start += len(df)
+                pickle.dump(df, out, protocol=pickle.HIGHEST_PROTOCOL)
+                yield df
+        os.replace(tmp_path, self._frames_path)
+
+def _convert_openpyxl_cell(cell):
+    # 与 pandas OpenpyxlReader._convert_cell 相同
+    if cell.value is None:
+        return ""
+    elif cell.data_type == "e":
+        return np.nan
+    elif cell.data_type == "n":
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+def _convert_calamine_cell(value):
+    # 与 pandas CalamineReader._convert_cell 相同
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        val = int(value)
+        if val == value:
+            return val
+        return value
+    elif isinstance(value, dt.date):
+        return pd.Timestamp(value)
+    elif isinstance(value, dt.timedelta):
+        return pd.Timedelta(value)
+    return value
+
+def _read_file_bytes(file):
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    with open(file, "rb") as fh:
+        return fh.read()
+
+def _trim_trailing_empty(row):
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+def normalize_contract_key(series: pd.Series) -> pd.Series:
+    s = series.astype(str)
+    s = s.str.replace(r"\.0$", "", regex=True) 
+    s = s.str.strip()
+    s = s.str.upper() 
+    s = s.str.replace('－', '-', regex=False)
+    return s
+
+class ContractKeys:
+    """
+    单次审核内共用的合同键字典：归一化合同号 <-> 整数编码。
+    原始文本按唯一值缓存归一化结果，同一合同号在各 sheet、参考表与漏填检查中只归一化一次；
+    参考行定位与漏填检查都在整数编码上进行。
+    """
+
+    def __init__(self):
+        self._keys = pd.Index([], dtype=object)        # 编码 -> 归一化合同号
+        self._raw = pd.Index([], dtype=object)         # 已见过的原始文本 (astype(str) 后)
+        self._raw_codes = np.empty(0, dtype=np.int64)  # 原始文本 -> 编码
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _lookup(self, index, values):
+        # 唯一值在字典中的位置 (哈希查找)，-1 表示新值
+        if len(index) == 0:
+            return np.full(len(values), -1, dtype=np.intp)
+        return index.get_indexer(values)
+
+    def encode_normalized(self, keys, unique=False):
+        """已归一化的合同号 (如参考表的 __KEY__) -> 编码数组；unique=True 表示 keys 互不重复。"""
+        keys = np.asarray(keys, dtype=object)
+        if unique:
+            codes, uniques = None, keys
+        else:
+            codes, uniques = pd.factorize(keys)
+        lut = self._lookup(self._keys, uniques)
+        new = lut < 0
+        if new.any():
+            # 唯一值互不相同，新值按出现顺序追加编码
+            lut[new] = np.arange(len(self._keys), len(self._keys) + new.sum())
+            self._keys = self._keys.append(pd.Index(uniques[new], dtype=object))
+        lut = lut.astype(np.int64)
+        return lut if codes is None else lut[codes]
+
+    def encode(self, series):
+        """原始合同列 -> 编码数组，与 normalize_contract_key(series) 逐元素对应。"""
+        # astype(str) 按列类型格式化 (如 float 列的 1.0)，须对整列执行；其余步骤逐元素，按唯一值缓存
+        codes, uniques = pd.factorize(series.astype(str))
+        pos = self._lookup(self._raw, uniques)
+        lut = np.empty(len(uniques), dtype=np.int64)
+        seen = pos >= 0
+        lut[seen] = self._raw_codes[pos[seen]]
+        if not seen.all():
+            raw_new = uniques[~seen]
+            normalized = normalize_contract_key(pd.Series(raw_new, dtype=object))
+            lut[~seen] = self.encode_normalized(normalized.to_numpy(dtype=object))
+            self._raw = self._raw.append(pd.Index(raw_new, dtype=object))
+            self._raw_codes = np.concatenate([self._raw_codes, lut[~seen]])
+        return lut[codes]
+
+    def learn(self, raw, normalized):
+        """
+        记下已知的归一化结果，之后相同的原始文本直接命中缓存：raw 为原始合同列，
+        normalized 为其中部分行 (按索引对齐) 去重后的 normalize_contract_key 结果，如参考表的 __KEY__。
+        """
+        # 归一化结果互不相同，对应的原始文本也互不相同
+        text = raw.astype(str).to_numpy(dtype=object)[raw.index.get_indexer(normalized.index)]
+        new = self._lookup(self._raw, text) < 0
+        if new.any():
+            keys = normalized.to_numpy(dtype=object)[new]
+            self._raw = self._raw.append(pd.Index(text[new], dtype=object))
+            self._raw_codes = np.concatenate([self._raw_codes, self.encode_normalized(keys, unique=True)])
+
+    def decode(self, codes):
+        """编码数组 -> 归一化合同号 (object 数组)。"""
+        return self._keys.to_numpy()[codes]
+
+# 取值种类占比不超过该阈值的文本列转为 category 存储
+COMPACT_CATEGORY_MAX_RATIO = 0.5
+
+def _category_column(series, max_ratio=COMPACT_CATEGORY_MAX_RATIO):
+    """
+    object 列转为 category；非空元素只含 str / int (互不相等，去重不会合并不同类型的取值)
+    且取值种类不多时才转换，否则返回 None。空值统一为 NaN (比对时与 None 等价)。
+    """
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind not in ("string", "integer", "mixed-integer"):
+        return None
+    values = series.to_numpy()
+    if kind != "string":
+        # infer_dtype 不区分 int 与 bool / numpy 整数等，逐个核对元素类型
+        na = series.isna().to_numpy()
+        if not set(map(type, values[~na])) <= {str, int}:
+            return None
+    codes, uniques = pd.factorize(values)
+    if len(uniques) > max_ratio * len(values):
+        return None
+    cat = pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(pd.Index(uniques, dtype=object)))
+    return pd.Series(cat, index=series.index, name=series.name)
+
+def compact_frame(df, arrow_cols=()):
+    """
+    文本列改用紧凑类型：arrow_cols 中无空值的纯文本列 (如 __KEY__) 存为 Arrow 字符串 (需 pyarrow)，
+    其余低基数的 object 列存为 category。Arrow 字符串的空值 astype(str) 为 "<NA>"，
+    与 object 列的 "nan" / "None" 不同，因此只用于无空值的列。
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype != object:
+            continue
+        if col in arrow_cols:
+            if pa is not None and pd.api.types.infer_dtype(s, skipna=False) == "string":
+                out[col] = s.astype("string[pyarrow]")
+            continue
+        compact = _category_column(s)
+        if compact is not None:
+            out[col] = compact
+    return df.assign(**out) if out else df
+
+def prepare_one_ref_df(ref_df, ref_contract_col, required_cols, prefix, reporter, keys=None):
+    # keys: 已归一化的合同键 (与 ref_df 逐行对应)，给出时不再重新归一化
+    if ref_df is None:
+        reporter.warning(f"⚠️ 参考文件 '{prefix}' 未加载 (df is None)。")
+        return pd.DataFrame(columns=['__KEY__'])
+        
+    if ref_contract_col is None:
+        reporter.warning(f"⚠️ 在 {prefix} 参考表中未找到'合同'列，跳过此数据源。")
+        return pd.DataFrame(columns=['__KEY__'])
+
+    cols_to_extract = []
+    col_mapping = {} 
+
+    for col_kw in required_cols:
+        actual_col = find_col(ref_df, col_kw)
+        
+        if actual_col:
+            cols_to_extract.append(actual_col)
+            col_mapping[actual_col] = f"ref_{prefix}_{col_kw}"
+        else:
+            reporter.warning(f"⚠️ 在 {prefix} 参考表中未找到列 (关键字: '{col_kw}')")
+            
+    if not cols_to_extract:
+        reporter.warning(f"⚠️ 在 {prefix} 参考表中未找到任何所需字段，跳过。")
+        return pd.DataFrame(columns=['__KEY__'])
+
+    cols_to_extract.append(ref_contract_col)
+    cols_to_extract_unique = list(set(cols_to_extract))
+    valid_cols = [col for col in cols_to_extract_unique if col in ref_df.columns]
+    std_df = ref_df[valid_cols].copy()
+    
+    std_df['__KEY__'] = normalize_contract_key(std_df[ref_contract_col]) if keys is None else keys
+    std_df = std_df.rename(columns=col_mapping)
+    final_cols = ['__KEY__'] + list(col_mapping.values())
+    final_cols_in_df = [col for col in final_cols if col in std_df.columns]
+    std_df = std_df[final_cols_in_df]
+    std_df = std_df.drop_duplicates(subset=['__KEY__'], keep='first')
+    # 合同键存为 Arrow 字符串，低基数文本列 (如提报人员、城市经理) 存为 category
+    return compact_frame(std_df, arrow_cols=('__KEY__',))
+
+class RefLookup:
+    """
+    参考查找表：ec / fk / product 三个标准化参考表按 __KEY__ 合并一次，
+    各 sheet 通过 rows() 一次定位参考行，替代逐表 pd.merge。
+    """
+
+    def __init__(self, all_std_dfs):
+        # 合同键在本次审核内统一编码，查找表按整数编码建索引
+        self.keys = ContractKeys()
+        frames = [
+            df.drop(columns='__KEY__').set_axis(
+                pd.Index(self.keys.encode_normalized(df['__KEY__'], unique=True), name='__KEY__'), axis=0,
+            )
+            for df in all_std_dfs.values() if not df.empty
+        ]
+        if frames:
+            table = pd.concat(frames, axis=1, join='outer')
+        else:
+            table = pd.DataFrame(index=pd.Index([], dtype=np.int64, name='__KEY__'))
+
+        # 外连接会把缺键的 int/bool 列提升为 float/object；记下原始类型，
+        # 取数后若无缺失再还原，与逐表 left merge 的结果类型一致
+        self._restore_dtypes = {
+            col: df[col].dtype
+            for df in frames for col in df.columns
+            if pd.api.types.is_integer_dtype(df[col].dtype) or pd.api.types.is_bool_dtype(df[col].dtype)
+        }
+        # 参考表预处理时已转为紧凑类型；旧版本快照加载的 object 列在此补做
+        self.table = compact_frame(table)
+
+        self._views = {}  # (列名, 比对类型, 是否还原类型或日期格式) -> ColumnView
+        self._row_hashes = None
+
+    def row_hashes(self, positions):
+        """参考行的内容指纹 (未命中为 0)，增量复审据此判断参考数据是否变化。"""
+        if self._row_hashes is None:
+            self._row_hashes = frame_row_hashes(self.table)
+        if len(self._row_hashes) == 0:
+            return np.zeros(len(positions), dtype=np.uint64)
+        return np.where(positions < 0, np.uint64(0), self._row_hashes[np.maximum(positions, 0)])
+
+    def column_signature(self, col, restored):
+        """参考列的类型特征：相同时，同一参考行归一化后的取值也相同。"""
+        return str(self.table[col].dtype), str(self._restore_dtypes.get(col)), restored
+
+    @property
+    def columns(self):
+        return self.table.columns
+
+    def rows(self, codes, index):
+        """按合同键编码 (self.keys.encode 的结果) 定位参考行，返回供单个 sheet 取数的 RefRows。"""
+        positions = self.table.index.get_indexer(codes)
+        return RefRows(self, positions, index)
+
+    def view(self, col, compare_type, restored=False):
+        """
+        整列归一化视图，按 (列名, 比对类型) 缓存：同一参考列无论被多少规则、
+        多少 sheet 使用，每次审核只归一化一次。
+        """
+        key = (col, compare_type, restored)
+        if key not in self._views:
+            if col in self._restore_dtypes:
+                s = self._typed_column(col, restored)
+            else:
+                s = self.table[col]
+            self._views[key] = ColumnView.from_series(s, compare_type)
+        return self._views[key]
+
+    def warm_views(self, rules):
+        """
+        预先按 rules (RuleSet) 归一化所有用到的参考列，并计算参考行指纹。
+        并行审核在写出子进程快照前调用，各子进程直接使用，不再各自重复归一化整列。
+        文本日期列除外：其解析格式按各 sheet 取到的值推断 (见 RefRows.view)。
+        """
+        if self._row_hashes is None:
+            self._row_hashes = frame_row_hashes(self.table)
+        for field_rules in rules.fields.values():
+            for rule in field_rules:
+                col = rule.ref_col
+                if col not in self.table.columns:
+                    continue
+                if rule.compare == 'date' and not pd.api.types.is_datetime64_any_dtype(self.table[col].dtype):
+                    continue
+                for restored in ((False, True) if col in self._restore_dtypes else (False,)):
+                    self.view(col, rule.compare, restored)
+
+    def date_view(self, col, date_format):
+        """
+        文本日期列按 date_format 整列解析的视图，按格式缓存，格式相同的 sheet 共用；
+        不能按取值解析 (见 _parse_by_value) 时为 None。
+        """
+        key = (col, 'date', date_format)
+        if key not in self._views:
+            s = _as_plain_series(self.table[col])
+            dates = _parse_by_value(s.to_numpy(), date_format)
+            view = None
+            if dates is not None:
+                view = ColumnView(s.index, s.isna().to_numpy(), na_like_vec(s).to_numpy(), dates=dates)
+                view.dates_by_value = True
+            self._views[key] = view
+        return self._views[key]
+
+    def _typed_column(self, col, restored):
+        # int/bool 列：restored 为原始类型的取值，否则为 left merge 缺键时的提升类型
+        # (影响 str() 结果，如 12 与 12.0)
+        s = self.table[col]
+        dtype = self._restore_dtypes[col]
+        if not restored:
+            return s.astype(float if pd.api.types.is_integer_dtype(dtype) else object)
+        present = s.notna().to_numpy()
+        values = s.to_numpy(dtype=object)
+        values[present] = s[present].astype(dtype).to_numpy().astype(object)
+        return pd.Series(values, index=s.index, dtype=object)
+
+class RefRows:
+    """单个 sheet 在参考查找表中的行位置 (-1 为未命中)。"""
+
+    def __init__(self, lookup, positions, index):
+        self.lookup = lookup
+        self.positions = positions
+        self.index = index
+        self.missing = positions < 0
+
+    def _restored(self, col):
+        # 与 left merge 一致：int/bool 列在全部命中且无缺失时保持原类型
+        if col not in self.lookup._restore_dtypes or self.missing.any():
+            return False
+        return not self.lookup.table[col].isna().to_numpy()[self.positions].any()
+
+    def column(self, col):
+        """取出单个参考列，结果与逐表 left merge 后的该列一致。"""
+        table_col = self.lookup.table[col]
+        if isinstance(table_col.dtype, pd.CategoricalDtype):
+            values = table_col.array
+        else:
+            values = table_col.to_numpy()
+        values = pd.api.extensions.take(values, self.positions, allow_fill=True)
+        # 显式指定 dtype，避免 object 列被推断为 datetime64
+        fetched = pd.Series(values, index=self.index, name=col, dtype=values.dtype)
+        if self._restored(col):
+            fetched = fetched.astype(self.lookup._restore_dtypes[col])
+        return fetched
+
+    def date_format(self, col):
+        """文本日期参考列在本 sheet 的解析格式 (按本 sheet 取到的首个非空值推断)；不是文本列时为 None。"""
+        dtype = self.lookup.table[col].dtype
+        if col in self.lookup._restore_dtypes or not (dtype == object or isinstance(dtype, pd.CategoricalDtype)):
+            return None
+        return datetime_format(_datetime_anchor(self.column(col)))
+
+    def view(self, col, compare_type):
+        """取出参考列在本 sheet 行上的归一化视图。"""
+        table_col = self.lookup.table[col]
+        if compare_type == 'date' and not pd.api.types.is_datetime64_any_dtype(table_col.dtype):
+            # 文本日期的格式由本 sheet 取到的首个非空值推断：整列按该格式解析一次，格式相同的 sheet 共用；
+            # 不能按取值解析 (如含带时区的取值) 时只解析本 sheet 取到的行
+            date_format = self.date_format(col)
+            full = None if date_format is None else self.lookup.date_view(col, date_format)
+            if full is None:
+                return ColumnView.from_series(_as_plain_series(self.column(col)), compare_type)
+            return full.take(self.positions, self.index)
+        full = self.lookup.view(col, compare_type, self._restored(col))
+        return full.take(self.positions, self.index)
+
+class ColumnView:
+    """
+    单列在某种比对类型下的归一化结果 (逐元素)。
+    列级的类型推断 (如 Series.apply 的 float 提升) 在比对时按实际取到的行计算。
+    文本以整数编码保存 (text_codes 指向 text_vocab)，比对时只比较编码。
+    """
+
+    def __init__(self, index, isna, na_like, values=None, is_num=None, is_str=None,
+                 text_codes=None, text_vocab=None, dates=None):
+        self.index = index
+        self.isna = isna
+        self.na_like = na_like
+        self.values = values
+        self.is_num = is_num
+        self.is_str = is_str
+        self.text_codes = text_codes
+        self.text_vocab = text_vocab
+        self.dates = dates
+        self.upcast = None  # 数值比对的列级类型提升，None 表示按本视图的行推断
+        self.dates_by_value = False  # 日期按取值逐个解析 (各行结果只取决于该行取值与列的格式)
+
+    @classmethod
+    def from_series(cls, series, compare_type, anchor=None):
+        view = cls(series.index, series.isna().to_numpy(), na_like_vec(series).to_numpy())
+        if compare_type != 'text':
+            series = _as_plain_series(series)
+        if compare_type == 'date':
+            view.dates, view.dates_by_value = parse_dates(series, anchor)
+        elif compare_type in ['num', 'num_term']:
+            view.values, view.is_num, view.is_str = _num_parts(series)
+        else:
+            view.text_codes, view.text_vocab = normalize_text_codes(series)
+        return view
+
+    def take(self, positions, index):
+        """按行位置取子集，位置 -1 视为未命中 (等同 left merge 得到的 NaN)。"""
+        missing = positions < 0
+        safe = np.where(missing, 0, positions)
+
+        def pick(arr, fill):
+            if len(arr) == 0:
+                return np.full(len(positions), fill, dtype=arr.dtype)
+            out = arr[safe]
+            out[missing] = fill
+            return out
+
+        view = ColumnView(index, pick(self.isna, True), pick(self.na_like, True))
+        if self.dates is not None:
+            view.dates = self.dates.take(positions, allow_fill=True)
+            view.dates_by_value = self.dates_by_value
+        if self.values is not None:
+            view.values = pick(self.values, np.nan)
+            view.is_num = pick(self.is_num, False)
+            view.is_str = pick(self.is_str, False)
+        if self.text_codes is not None:
+            # 未命中行为空文本，即 vocab[0]
+            view.text_codes = pick(self.text_codes, 0)
+            view.text_vocab = self.text_vocab
+        return view
+
+# =====================================
+# 📅 日期解析与比较
+# =====================================
+# pandas 查找首个非空值时视为空的字符串 (to_datetime 按该值推断整列的日期格式)
+_DATETIME_NULL_STRINGS = {"", "NaT", "nat", "NAT", "nan", "NaN", "NAN", "now", "today"}
+
+def _datetime_anchor(series):
+    """to_datetime 推断格式所依据的首个非空值 (以单元素列表返回)，没有时返回空列表。"""
+    for v in series:
+        if isinstance(v, str):
+            if v not in _DATETIME_NULL_STRINGS:
+                return [v]
+        elif not pd.isna(v):
+            return [v]
+    return []
+
+def datetime_format(anchor):
+    """
+    pd.to_datetime 按首个非空值 (_datetime_anchor 的结果) 推断的整列格式；
+    首个非空值不是文本或推断不出格式时为 "mixed"，即逐个取值分别解析。
+    """
+    if anchor and type(anchor[0]) is str:
+        fmt = guess_datetime_format(anchor[0])
+        if fmt is not None:
+            return fmt
+    return "mixed"
+
+def parse_dates(series, anchor=None):
+    """
+    与 pd.to_datetime(series, errors='coerce') 相同的解析结果 (DatetimeArray)，返回 (解析结果, 是否按取值解析)。
+    object 列的格式按首个非空值只推断一次，能按取值解析时只解析不重复的取值。
+    anchor 为分块时整列的首个非空值 (_datetime_anchor 的结果)，结果与整列一次解析相同。
+    """
+    if series.dtype != object:
+        return pd.to_datetime(series, errors='coerce').array, True
+    own_anchor = _datetime_anchor(series) if anchor is None else anchor
+    dates = _parse_by_value(series.to_numpy(), datetime_format(own_anchor))
+    if dates is not None:
+        return dates, True
+    if anchor is None:
+        return pd.to_datetime(series, errors='coerce').array, False
+    # 逐行依次解析：块前补上整列的首个非空值，由 pandas 按同样的格式解析
+    padded = pd.Series(list(anchor) + series.tolist(), dtype=object)
+    return pd.to_datetime(padded, errors='coerce').array[len(anchor):], False
+
+def _parse_by_value(values, date_format):
+    """
+    按 date_format 只解析不重复的取值，再按编码映射回各行。
+    pandas 遇到带时区的取值时各行结果互相影响 (先解析出的一方使另一方成为 NaT)，
+    此时不能按取值解析，返回 None。
+    """
+    codes, uniques = _factorize_typed(values)
+    try:
+        parsed = pd.to_datetime(uniques, format=date_format, errors='coerce', cache=False)
+        if not _is_naive_dates(parsed.array):
+            return None
+        # 解析失败的取值单独再解析也应失败，否则是受其他取值影响才成为 NaT
+        failed = uniques[np.asarray(parsed.isna()) & ~pd.isna(uniques)]
+        if len(failed) and pd.to_datetime(failed, format=date_format, errors='coerce', cache=False).notna().any():
+            return None
+    except (ValueError, TypeError):
+        return None
+    return parsed.array.take(codes)
+
+def _factorize_typed(values):
+    """
+    按 (取值, 类型) 编码：相等但类型不同的取值 (如 True 与 1、20240105 与 20240105.0) 解析结果可能不同，
+    不能合并。返回 (各行编码, 每个编码首次出现的取值)。
+    """
+    n = len(values)
+    codes, _ = pd.factorize(values, use_na_sentinel=True)
+    kinds, kind_values = pd.factorize(pd.Series(values, dtype=object).map(type))
+    key = np.where(codes < 0, -1, codes.astype(np.int64) * len(kind_values) + kinds)
+    codes, uniq_keys = pd.factorize(key)
+    first = np.empty(len(uniq_keys), dtype=np.intp)
+    first[codes[::-1]] = np.arange(n, dtype=np.intp)[::-1]
+    return codes, values[first]
+
+def _is_dates(dates):
+    return dates.dtype.kind == 'M'
+
+def _is_naive_dates(dates):
+    return isinstance(dates.dtype, np.dtype) and dates.dtype.kind == 'M'
+
+def _date_days(dates):
+    """日期部分 (带时区时按本地时间) 的 int64 天数，NaT 位置的值无意义。"""
+    if not _is_naive_dates(dates):
+        dates = dates.tz_localize(None)
+    return dates.to_numpy().astype('datetime64[D]').view(np.int64)
+
+def _as_plain_series(s):
+    # category 列还原为普通 object 列再参与比对
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.astype(object)
+    return s
+
+def _text_codes_differ(v_main, v_ref):
+    # 归一化文本按编码比较：主表词表先映射到参考词表 (-1 为参考中没有的文本，必不相等)
+    if v_main.text_vocab is v_ref.text_vocab:
+        return v_main.text_codes != v_ref.text_codes
+    lut = pd.Index(v_ref.text_vocab).get_indexer(v_main.text_vocab)
+    return lut[v_main.text_codes] != v_ref.text_codes
+
+def compare_views(v_main, v_ref, compare_type='text', tolerance=0):
+    """基于归一化视图的比对，逐行结果与原先逐元素 apply 的整列比对一致 (见 tests/test_normalize.py)。"""
+    index = v_main.index
+    merge_failed_mask = pd.Series(v_ref.isna, index=index)
+    main_is_na = pd.Series(v_main.na_like, index=index)
+    ref_is_na = pd.Series(v_ref.na_like, index=index)
+    both_are_na = main_is_na & ref_is_na
+    
+    errors = pd.Series(False, index=index)
+
+    if compare_type == 'date':
+        d_main = pd.Series(v_main.dates, index=index)
+        d_ref = pd.Series(v_ref.dates, index=index)
+        
+        valid_dates_mask = d_main.notna() & d_ref.notna()
+        if _is_dates(v_main.dates) and _is_dates(v_ref.dates):
+            # 按天数 (int64) 比较日期部分，不逐行构造 datetime.date
+            date_diff_mask = pd.Series(_date_days(v_main.dates) != _date_days(v_ref.dates), index=index)
+        else:
+            date_diff_mask = (d_main.dt.date != d_ref.dt.date)
+        errors = valid_dates_mask & date_diff_mask
+        
+        one_is_date_one_is_not = (d_main.notna() & d_ref.isna() & ~ref_is_na) | \
+                                 (d_main.isna() & ~main_is_na & d_ref.notna())
+        errors |= one_is_date_one_is_not
+
+    elif compare_type in ['num', 'num_term']:
+        v_main_vals = pd.Series(v_main.values, index=index)
+        v_ref_vals = pd.Series(v_ref.values, index=index)
+        is_num_main = pd.Series(_apply_num_upcast(v_main.is_num, v_main.is_str, v_main.upcast), index=index)
+        is_num_ref = pd.Series(_apply_num_upcast(v_ref.is_num, v_ref.is_str, v_ref.upcast), index=index)
+        both_are_num = is_num_main & is_num_ref
+
+        if both_are_num.any():
+            diff = (v_main_vals[both_are_num] - v_ref_vals[both_are_num]).abs()
+            
+            if compare_type == 'num_term':
+                errors.loc[both_are_num] = (diff >= 1.0)
+            else:
+                errors.loc[both_are_num] = (diff > (tolerance + 1e-6))
+                
+        one_is_num_one_is_not = (is_num_main & ~is_num_ref & ~ref_is_na) | \
+                                (~is_num_main & ~main_is_na & is_num_ref)
+        errors |= one_is_num_one_is_not
+
+    else: 
+        errors = pd.Series(_text_codes_differ(v_main, v_ref), index=index)
+
+    final_errors = errors & ~both_are_na
+    lookup_failure_mask = merge_failed_mask & ~main_is_na
+    final_errors = final_errors & ~lookup_failure_mask
+    
+    return final_errors
+
+# =====================================
+# 🔁 增量复审：行指纹与上次审核状态
+# =====================================
+NUM_COMPARE_TYPES = ('num', 'num_term')
+
+def _element_type_names(series):
+    # 逐元素类型名；category 列按类别计算 (编码 -1 为缺失，与 object 列的 NaN 同为 float)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        names = [type(v).__name__ for v in series.cat.categories] + ["float"]
+        return pd.Series(np.array(names, dtype=object)[series.cat.codes.to_numpy()], index=series.index)
+    return series.map(lambda v: type(v).__name__)
+
+def frame_row_hashes(df):
+    """逐行内容指纹 (uint64)；object 列额外计入元素类型，区分 1 / 1.0 / "1" / True。"""
+    if df.shape[1] == 0:
+        return np.zeros(len(df), dtype=np.uint64)
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    obj = df.select_dtypes(include=[object, "category"])
+    if obj.shape[1]:
+        types = obj.apply(_element_type_names)
+        hashes = hashes ^ (pd.util.hash_pandas_object(types, index=False).to_numpy()
+                           * np.uint64(0x9E3779B97F4A7C15))
+    return hashes
+
+class SheetAuditState:
+    """
+    单个 sheet 一次审核后保留的状态：行指纹、错误矩阵与结果文件。
+    下次上传时，内容与参考行都没变的行直接沿用上次的错误，只重新比对变化的行。
+    """
+
+    def __init__(self, columns, dtypes, keys, row_hashes, ref_hashes, ref_signature, errors):
+        self.columns = columns
+        self.dtypes = dtypes
+        self.keys = keys
+        self.row_hashes = row_hashes
+        self.ref_hashes = ref_hashes
+        self.ref_signature = ref_signature
+        self.errors = errors
+        self.files_dict = None
+        self.num_parts = {}  # 主表列名 -> (is_num, is_str)，列级类型提升需要整列信息
+        self.upcast = {}     # (字段, 参考列) -> (主表列是否整列提升, 参考列是否整列提升)
+        self.date_formats = {}  # (字段, 参考列) -> (主表列日期格式, 参考列日期格式)，不能按取值解析时为 None
+
+    def compatible(self, previous):
+        """列、类型、审核字段与参考列类型都相同时，上次的逐行结果才能沿用。"""
+        return (self.columns == previous.columns and self.dtypes == previous.dtypes
+                and self.errors.fields == previous.errors.fields
+                and np.array_equal(self.errors.field_cols, previous.errors.field_cols)
+                and self.ref_signature == previous.ref_signature)
+
+    def adopt(self, previous, prev_pos):
+        """
+        各行与上次审核完全相同 (行数、顺序都不变) 时沿用上次的错误矩阵与结果文件，返回是否沿用。
+        prev_pos 为 match_rows 的结果；沿用的结果文件由调用方经 ArtifactRun.adopt_reports 转入本次审核。
+        """
+        if len(prev_pos) != len(previous.row_hashes) or not np.array_equal(prev_pos, np.arange(len(prev_pos))):
+            return False
+        # 上次的结果文件已被清理时不能整体沿用 (仍可按行沿用错误，重新写出文件)
+        if previous.files_dict is None or not files_available(previous.files_dict):
+            return False
+        self.errors = previous.errors
+        self.num_parts, self.upcast = previous.num_parts, previous.upcast
+        self.date_formats = getattr(previous, "date_formats", {})
+        self.files_dict = previous.files_dict
+        return True
+
+    def match_rows(self, previous):
+        """本次每行在上次审核中的行位置 (主表内容与参考行都相同)，-1 表示需要重新比对。"""
+        prev = pd.DataFrame({
+            "row": previous.row_hashes, "ref": previous.ref_hashes,
+            "pos": np.arange(len(previous.row_hashes)),
+        }).drop_duplicates(["row", "ref"])
+        cur = pd.DataFrame({"row": self.row_hashes, "ref": self.ref_hashes})
+        pos = cur.merge(prev, on=["row", "ref"], how="left")["pos"]
+        return pos.fillna(-1).to_numpy(dtype=np.intp)
+
+class AuditState:
+    """一次完整审核的状态 ({sheet: SheetAuditState})，作为下次 run_full_audit 的 baseline。"""
+
+    def __init__(self, sheets):
+        self.ruleset = RULESET_VERSION
+        self.sheets = sheets
+        self.run_id = uuid.uuid4().hex
+
+    def sheet(self, sheet_name):
+        # 规则集变化后上次的结果不可沿用
+        if self.ruleset != RULESET_VERSION:
+            return None
+        return self.sheets.get(sheet_name)
+
+def _error_cells(state):
+    frames = [
+        pd.DataFrame({
+            "sheet": sheet_name,
+            "合同": s.keys[rows],
+            "字段": np.asarray(s.errors.fields, dtype=object)[fields],
+        })
+        for sheet_name, s in state.sheets.items()
+        for rows, fields in [np.nonzero(s.errors.data)]
+    ]
+    if not frames:
+        return pd.DataFrame(columns=["sheet", "合同", "字段"])
+    return pd.concat(frames, ignore_index=True).drop_duplicates()
+
+def diff_audit_states(previous, current):
+    """按 (sheet, 合同, 字段) 对比两次审核的错误，状态为 已修复 / 新增 / 仍存在。"""
+    diff = _error_cells(previous).merge(_error_cells(current), how="outer", indicator=True)
+    diff["状态"] = diff.pop("_merge").map({"left_only": "已修复", "right_only": "新增", "both": "仍存在"})
+    return diff.astype({"状态": object})
+
+def _skip_mask(rule, ref_rows):
+    # 参考值为空或属于 skip_ref_values 的行不比对 (如城市经理为空 / 0)
+    if rule.skip_ref_values is None:
+        return None
+    s_ref = ref_rows.column(rule.ref_col)
+    if isinstance(s_ref.dtype, pd.CategoricalDtype):
+        # 只判断各类别，按类别编码展开 (编码 -1 为缺失，同样跳过)
+        cats = pd.Series(s_ref.cat.categories, dtype=object)
+        hit = cats.astype(str).str.strip().str.lower().isin(rule.skip_ref_values).to_numpy()
+        return np.append(hit, True)[s_ref.cat.codes.to_numpy()]
+    str_val = s_ref.astype(str).str.strip().str.lower()
+    return (pd.isna(s_ref) | str_val.isin(rule.skip_ref_values)).to_numpy()
+
+def _main_view(main_views, main_col, s_main, compare_type):
+    # 同一主表列按同一类型的归一化在一个 sheet 内只做一次，多条规则共用
+    key = (main_col, compare_type)
+    if key not in main_views:
+        main_views[key] = ColumnView.from_series(s_main, compare_type)
+    return main_views[key]
+
+def _compare_rule(rule, main_col, s_main, ref_rows, state, main_views):
+    """整列比对一条规则，并在 state 中记下数值列的列级类型信息。"""
+    v_main = _main_view(main_views, main_col, s_main, rule.compare)
+    # 参考列视图来自按 (列, 比对类型) 缓存的整列归一化结果
+    v_ref = ref_rows.view(rule.ref_col, rule.compare)
+    if rule.compare == 'date':
+        state.date_formats[(rule.field, rule.ref_col)] = _date_formats(v_main, s_main, ref_rows, v_ref, rule.ref_col)
+    if rule.compare in NUM_COMPARE_TYPES:
+        state.num_parts[main_col] = (v_main.is_num, v_main.is_str)
+        state.upcast[(rule.field, rule.ref_col)] = (
+            _num_upcast_flag(v_main.is_num, v_main.is_str), _num_upcast_flag(v_ref.is_num, v_ref.is_str),
+        )
+    mask = compare_views(v_main, v_ref, rule.compare, rule.tolerance).to_numpy()
+    skip = _skip_mask(rule, ref_rows)
+    return mask if skip is None else mask & ~skip
+
+def _compare_rule_rows(rule, main_col, s_main, ref_rows, state, main_views, baseline, prev_pos, rows):
+    """
+    只比对 rows 行；数值比对的列级类型提升按整列 (沿用行 + 变化行) 计算，
+    提升结果与上次不同时需整列重比，返回 None。日期列按整列首个非空值推断的格式解析变化行。
+    """
+    if rule.compare == 'date':
+        # 日期按整列解析后取变化行 (只解析不重复的取值，代价小)；主表或参考列的格式与上次不同、
+        # 或不能按取值解析时，沿用行的解析结果也可能变，需整列重比 (旧版本保存的状态同样整列重比)
+        key = (rule.field, rule.ref_col)
+        v_main_full = _main_view(main_views, main_col, s_main, rule.compare)
+        v_ref_full = ref_rows.view(rule.ref_col, rule.compare)
+        formats = _date_formats(v_main_full, s_main, ref_rows, v_ref_full, rule.ref_col)
+        if formats is None or getattr(baseline, "date_formats", {}).get(key) != formats:
+            return None
+        state.date_formats[key] = formats
+        v_main = v_main_full.take(rows, s_main.index[rows])
+    else:
+        v_main = _main_view(main_views, main_col, s_main.iloc[rows], rule.compare)
+        v_ref_full = ref_rows.view(rule.ref_col, rule.compare)
+    v_ref = v_ref_full.take(rows, v_main.index)
+    if rule.compare in NUM_COMPARE_TYPES:
+        key = (rule.field, rule.ref_col)
+        if main_col not in baseline.num_parts or key not in baseline.upcast:
+            return None
+        kept = prev_pos >= 0
+        is_num = np.empty(len(prev_pos), dtype=bool)
+        is_str = np.empty(len(prev_pos), dtype=bool)
+        prev_num, prev_str = baseline.num_parts[main_col]
+        is_num[kept], is_str[kept] = prev_num[prev_pos[kept]], prev_str[prev_pos[kept]]
+        is_num[rows], is_str[rows] = v_main.is_num, v_main.is_str
+        flags = (_num_upcast_flag(is_num, is_str), _num_upcast_flag(v_ref_full.is_num, v_ref_full.is_str))
+        if flags != baseline.upcast[key]:
+            return None
+        state.num_parts[main_col] = (is_num, is_str)
+        state.upcast[key] = flags
+        v_ref.upcast = flags[1]
+        mask = compare_views(_with_upcast(v_main, flags[0]), v_ref, rule.compare, rule.tolerance).to_numpy()
+    else:
+        mask = compare_views(v_main, v_ref, rule.compare, rule.tolerance).to_numpy()
+    skip = _skip_mask(rule, ref_rows)
+    return mask if skip is None else mask & ~skip[rows]
+
+def _date_formats(v_main, s_main, ref_rows, v_ref, ref_col):
+    # 主表列与参考列各自按整列首个非空值推断的日期格式 (不是文本列时为 None)；
+    # 任一方不能按取值解析时为 None
+    if not (v_main.dates_by_value and v_ref.dates_by_value):
+        return None
+    main_format = datetime_format(_datetime_anchor(s_main)) if s_main.dtype == object else None
+    return main_format, ref_rows.date_format(ref_col)
+
+def _with_upcast(view, upcast):
+    # 共用的主表视图不改动，复制一份浅视图再指定列级类型提升
+    out = ColumnView(view.index, view.isna, view.na_like, view.values, view.is_num, view.is_str,
+                     view.text_codes, view.text_vocab, view.dates)
+    out.upcast = upcast
+    return out
+
+# =====================================
+# 🧮 (修改) 审核函数 - 现在返回文件
+# =====================================
+def audit_sheet_vec(sheet_name, main_store, ref_lookup, rules, reporter, baseline=None, artifacts=None):
+    """
+    按规则集 rules (RuleSet) 审核单个 sheet，返回值同 audit_one_sheet。
+    baseline 为上次审核该 sheet 的 SheetAuditState 时只重新比对变化的行；
+    artifacts 为结果文件存放的 ArtifactRun (默认保存在内存中)。
+    """
+    artifacts = artifacts or ArtifactRun()
+    # (注意: main_store 是 WorkbookStore，整个审核过程中只解析一次)
+    with reporter.stage("解析主表", sheet_name) as st:
+        header_offset = get_header_row(main_store, sheet_name)
+        # (注意: main_df 为 WorkbookStore 中的共享对象，只读，不再复制)
+        main_df = main_store.frame(sheet_name, header=header_offset)
+        st.rows = len(main_df)
+    reporter.write(f"📘 审核中：{sheet_name}（header={header_offset}）")
+
+    contract_col_main = find_col(main_df, "合同")
+    if not contract_col_main:
+        reporter.error(f"❌ {sheet_name} 中未找到“合同”列，已跳过。")
+        return None
+
+    with reporter.stage("定位参考行", sheet_name, len(main_df)):
+        main_codes = ref_lookup.keys.encode(main_df[contract_col_main])
+
+        # 一次定位参考行：按合同键编码在合并好的参考查找表中取行位置
+        ref_rows = ref_lookup.rows(main_codes, main_df.index)
+        # 本 sheet 出现的合同 (漏填检查用)
+        contracts = np.unique(main_codes[main_df[contract_col_main].notna().to_numpy()])
+
+    # 执行计划：字段关键词按本 sheet 列名解析一次，缺列的字段与规则不参与比对
+    plan = rules.plan(main_df.columns, ref_lookup.columns)
+    col_name_to_idx = {name: i for i, name in enumerate(main_df.columns)}
+
+    # 错误状态：行 × 审核字段 的布尔矩阵 (只登记主表中能找到对应列的字段)
+    errors = ErrorMatrix(len(main_df), [(field, col_idx) for _, field, _, col_idx, _ in plan.fields])
+
+    state = SheetAuditState(
+        list(main_df.columns), [str(t) for t in main_df.dtypes], ref_lookup.keys.decode(main_codes),
+        frame_row_hashes(main_df), ref_lookup.row_hashes(ref_rows.positions),
+        {col: ref_lookup.column_signature(col, ref_rows._restored(col)) for col in plan.ref_cols},
+        errors,
+    )
+
+    # 增量复审：按 (行指纹, 参考行指纹) 找到上次审核中的同一行，只重新比对找不到的行
+    prev_pos = None
+    if baseline is not None and state.compatible(baseline):
+        prev_pos = state.match_rows(baseline)
+        if state.adopt(baseline, prev_pos):
+            state.files_dict = artifacts.adopt_reports(state.files_dict)
+            reporter.success(f"♻️ {sheet_name} 与上次审核相比没有变化，沿用上次结果（{state.errors.total} 处错误）")
+            return state.errors, state.files_dict, contracts, state
+        changed_rows = np.flatnonzero(prev_pos < 0)
+        kept = prev_pos >= 0
+        reporter.info(f"🔁 {sheet_name}: {len(changed_rows)}/{len(prev_pos)} 行有变化，只重新比对这些行")
+
+    reporter.progress(sheet_name, 0)
+
+    main_views, changed_views = {}, {}
+    for field_idx, (pos, main_kw, main_col, _, field_rules) in enumerate(plan.fields):
+        reporter.status(sheet_name, f"检查「{sheet_name}」: {main_kw}...")
+
+        s_main = main_df[main_col]
+
+        field_mask = None
+        if prev_pos is not None:
+            # 未变化的行沿用上次该字段的结果，变化的行逐条规则重新比对
+            row_masks = []
+            for rule in field_rules:
+                with reporter.stage(f"比对 {main_kw} ← {rule.ref_col}", sheet_name, len(changed_rows)):
+                    row_masks.append(_compare_rule_rows(rule, main_col, s_main, ref_rows, state,
+                                                        changed_views, baseline, prev_pos, changed_rows))
+            if all(m is not None for m in row_masks):
+                field_mask = np.zeros(len(main_df), dtype=bool)
+                field_mask[kept] = baseline.errors.data[prev_pos[kept], field_idx]
+                for m in row_masks:
+                    field_mask[changed_rows] |= m
+        if field_mask is None:
+            field_mask = np.zeros(len(main_df), dtype=bool)
+            for rule in field_rules:
+                with reporter.stage(f"比对 {main_kw} ← {rule.ref_col}", sheet_name, len(main_df)):
+                    field_mask |= _compare_rule(rule, main_col, s_main, ref_rows, state, main_views)
+        errors.mark(field_idx, field_mask)
+
+        reporter.progress(sheet_name, (pos + 1) / plan.total)
+
+    reporter.status(sheet_name, f"「{sheet_name}」比对完成，正在生成标注文件...")
+
+    # 5. === 流式写入 Excel 并标注 ===
+    # 增量复审只重新比对了变化的行，两个结果文件都留到首次取用时生成 (不为几处修改重写整个文件)；
+    # 调用方要求全部即时生成 (lazy_reports=()) 时除外
+    lazy = tuple(REPORT_FILENAMES) if prev_pos is not None and artifacts.lazy else None
+    with reporter.stage("写出结果文件", sheet_name, len(main_df)):
+        files_to_save = write_audit_reports(
+            sheet_name, main_df, header_offset, errors, col_name_to_idx.get(contract_col_main), reporter, artifacts,
+            lazy,
+        )
+    state.files_dict = files_to_save
+
+    reporter.success(f"✅ {sheet_name} 审核完成，共发现 {errors.total} 处错误")
+    
+    # (修改) 返回错误矩阵, files_dict, 合同编码和审核状态
+    return errors, files_to_save, contracts, state
+
+# =====================================
+# 🌊 流式分块审核 (超大 sheet)
+# =====================================
+def _chunk_view(series, compare_type, anchors):
+    """
+    单块的主表归一化视图。object 日期列按整列的首个非空值 (首个含非空值的块记下) 解析，
+    与整列一次解析的结果相同。
+    """
+    if compare_type == 'date' and series.dtype == object:
+        prefix = anchors.get(series.name)
+        if not prefix:
+            anchors[series.name] = _datetime_anchor(series)
+        return ColumnView.from_series(series, compare_type, prefix or None)
+    return ColumnView.from_series(series, compare_type)
+
+def audit_sheet_stream(sheet_name, sheet, header_offset, ref_lookup, rules, reporter, baseline=None,
+                       artifacts=None):
+    """
+    流式分块审核单个 sheet (sheet 为 WorkbookStore.chunked() 的结果)：各块逐块读回、比对并直接写入结果文件，
+    主表内存占用随块大小而非 sheet 大小增长；逐行结果与 audit_sheet_vec 相同。
+    整列才能确定的信息 (合同键对应的参考行、数值列的类型提升、日期格式) 先按块汇总，再逐块比对。
+    返回值同 audit_one_sheet。
+    """
+    artifacts = artifacts or ArtifactRun()
+    reporter.write(f"📘 审核中：{sheet_name}（header={header_offset}，每块 {sheet.chunk_rows} 行）")
+
+    columns = sheet.columns
+    contract_col_main = find_col(pd.DataFrame(columns=columns), "合同")
+    if not contract_col_main:
+        reporter.error(f"❌ {sheet_name} 中未找到“合同”列，已跳过。")
+        return None
+
+    plan = rules.plan(columns, ref_lookup.columns)
+    num_cols = {
+        main_col for _, _, main_col, _, field_rules in plan.fields
+        for rule in field_rules if rule.compare in NUM_COMPARE_TYPES
+    }
+
+    # 1. 按块汇总：合同键、行指纹、数值列的逐行类型
+    n = sheet.n_rows
+    codes = np.empty(n, dtype=np.int64)
+    present = np.empty(n, dtype=bool)
+    row_hashes = np.empty(n, dtype=np.uint64)
+    num_parts = {col: (np.empty(n, dtype=bool), np.empty(n, dtype=bool)) for col in num_cols}
+    reporter.status(sheet_name, f"读取「{sheet_name}」: 共 {n} 行，{sheet.n_chunks} 块...")
+    with reporter.stage("解析分块并汇总合同键", sheet_name, n):
+        for df in sheet.frames():
+            rows = slice(df.index[0], df.index[-1] + 1)
+            codes[rows] = ref_lookup.keys.encode(df[contract_col_main])
+            present[rows] = df[contract_col_main].notna().to_numpy()
+            row_hashes[rows] = frame_row_hashes(df)
+            for col in num_cols:
+                _, num_parts[col][0][rows], num_parts[col][1][rows] = _num_parts(df[col])
+
+    with reporter.stage("定位参考行", sheet_name, n):
+        ref_rows = ref_lookup.rows(codes, pd.RangeIndex(n))
+    contracts = np.unique(codes[present])
+    errors = ErrorMatrix(n, [(field, col_idx) for _, field, _, col_idx, _ in plan.fields])
+    state = SheetAuditState(
+        list(columns), [str(t) for t in sheet.dtypes], ref_lookup.keys.decode(codes),
+        row_hashes, ref_lookup.row_hashes(ref_rows.positions),
+        {col: ref_lookup.column_signature(col, ref_rows._restored(col)) for col in plan.ref_cols},
+        errors,
+    )
+    if baseline is not None and state.compatible(baseline) and state.adopt(baseline, state.match_rows(baseline)):
+        state.files_dict = artifacts.adopt_reports(state.files_dict)
+        reporter.success(f"♻️ {sheet_name} 与上次审核相比没有变化，沿用上次结果（{state.errors.total} 处错误）")
+        return state.errors, state.files_dict, contracts, state
+
+    # 2. 整列信息：参考列视图、跳过条件与数值列的类型提升，每个 sheet 只算一次
+    state.num_parts = num_parts
+    main_upcast = {col: _num_upcast_flag(*num_parts[col]) for col in num_cols}
+    ref_views, skip_masks = {}, {}
+    with reporter.stage("准备参考列视图", sheet_name, n):
+        for _, main_kw, main_col, _, field_rules in plan.fields:
+            for rule in field_rules:
+                key = (rule.ref_col, rule.compare)
+                if key not in ref_views:
+                    ref_views[key] = ref_rows.view(rule.ref_col, rule.compare)
+                if rule.compare in NUM_COMPARE_TYPES:
+                    v_ref = ref_views[key]
+                    state.upcast[(main_kw, rule.ref_col)] = (
+                        main_upcast[main_col], _num_upcast_flag(v_ref.is_num, v_ref.is_str),
+                    )
+                skip_masks[id(rule)] = _skip_mask(rule, ref_rows)
+
+    # 3. 逐块比对并写出
+    col_name_to_idx = {name: i for i, name in enumerate(columns)}
+    contract_col_idx = col_name_to_idx.get(contract_col_main)
+    writer = artifacts.report_writer(sheet_name, columns, header_offset, contract_col_idx, reporter)
+    reporter.progress(sheet_name, 0)
+    anchors = {}
+    for chunk_idx, df in enumerate(sheet.frames(), start=1):
+        reporter.status(sheet_name, f"检查「{sheet_name}」: 第 {chunk_idx}/{sheet.n_chunks} 块...")
+        rows = slice(df.index[0], df.index[-1] + 1)
+        positions = np.arange(rows.start, rows.stop)
+        main_views = {}
+        for field_idx, (_, main_kw, main_col, _, field_rules) in enumerate(plan.fields):
+            for rule in field_rules:
+                with reporter.stage(f"比对 {main_kw} ← {rule.ref_col}", sheet_name, len(df)):
+                    view_key = (main_col, rule.compare)
+                    if view_key not in main_views:
+                        main_views[view_key] = _chunk_view(df[main_col], rule.compare, anchors)
+                    v_main = main_views[view_key]
+                    v_ref = ref_views[(rule.ref_col, rule.compare)].take(positions, df.index)
+                    if rule.compare in NUM_COMPARE_TYPES:
+                        v_main.upcast, v_ref.upcast = state.upcast[(main_kw, rule.ref_col)]
+                    mask = compare_views(v_main, v_ref, rule.compare, rule.tolerance).to_numpy()
+                    skip = skip_masks[id(rule)]
+                    errors.data[rows, field_idx] |= mask if skip is None else mask & ~skip[rows]
+        with reporter.stage("写出结果文件", sheet_name, len(df)):
+            writer.write(df, errors, rows.start)
+        reporter.progress(sheet_name, chunk_idx / sheet.n_chunks)
+
+    reporter.status(sheet_name, f"「{sheet_name}」比对完成，正在生成标注文件...")
+    with reporter.stage("保存结果文件", sheet_name, n):
+        state.files_dict = artifacts.finish_reports(writer, sheet_name, header_offset, errors, contract_col_idx)
+
+    reporter.success(f"✅ {sheet_name} 审核完成，共发现 {errors.total} 处错误")
+    return errors, state.files_dict, contracts, state
+
+# =====================================
+# 🧾 错误矩阵
+# =====================================
+class ErrorMatrix:
+    """
+    单个 sheet 的审核错误：行 × 审核字段 的布尔矩阵。
+    行级、字段级错误数均由矩阵归约得到，结果文件与统计摘要都从这里读取。
+    """
+
+    def __init__(self, n_rows, fields):
+        # fields: [(字段关键词, 主表列下标), ...]
+        self.fields = [kw for kw, _ in fields]
+        self.field_cols = np.array([col for _, col in fields], dtype=np.intp)
+        self.data = np.zeros((n_rows, len(fields)), dtype=bool)
+
+    def mark(self, field_idx, mask):
+        self.data[:, field_idx] |= mask
+
+    @property
+    def total(self):
+        return int(self.data.sum())
+
+    def row_mask(self):
+        return self.data.any(axis=1)
+
+    def field_counts(self):
+        return dict(zip(self.fields, self.data.sum(axis=0).tolist()))
+
+    def error_columns(self, row):
+        """某一行中需要标红的主表列下标 (多个字段落在同一列时只标一次)。"""
+        return np.unique(self.field_cols[self.data[row]])
+
+# =====================================
+# 📝 流式写出审核结果文件
+# =====================================
+RED_COLOR = "FFC7CE"
+YELLOW_COLOR = "FFFF00"
+
+class _OpenpyxlReportSheet:
+    """openpyxl write_only 单表写出器：逐行追加，只为上色单元格创建 WriteOnlyCell。"""
+
+    FILLS = {
+        color: PatternFill(start_color=color, end_color=color, fill_type="solid")
+        for color in (RED_COLOR, YELLOW_COLOR)
+    }
+
+    def __init__(self):
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet()
+
+    def append(self, values, fills=None):
+        if not fills:
+            self._ws.append(values)
+            return
+        row = list(values)
+        for c, color in fills.items():
+            cell = WriteOnlyCell(self._ws, value=row[c])
+            cell.fill = self.FILLS[color]
+            row[c] = cell
+        self._ws.append(row)
+
+    def append_column(self, values, color=None):
+        """把 values 逐行写到第一列 (每行一个单元格)。"""
+        fill = self.FILLS[color] if color is not None else None
+        for v in values:
+            cell = WriteOnlyCell(self._ws, value=v)
+            if fill is not None:
+                cell.fill = fill
+            self._ws.append([cell])
+
+    def save(self):
+        stream = BytesIO()
+        self._wb.save(stream)
+        stream.seek(0)
+        return stream
+
+class _XlsxwriterReportSheet:
+    """xlsxwriter constant_memory 单表写出器：写出后的行即刻落盘，单元格格式与 openpyxl 写出一致。"""
+
+    NUMBER_FORMATS = {
+        dt.datetime: "yyyy-mm-dd h:mm:ss",
+        dt.date: "yyyy-mm-dd",
+        dt.time: "h:mm:ss",
+        dt.timedelta: "[hh]:mm:ss",
+    }
+
+    def __init__(self):
+        self._stream = BytesIO()
+        self._wb = xlsxwriter.Workbook(self._stream, {"constant_memory": True, "nan_inf_to_errors": True})
+        self._ws = self._wb.add_worksheet("Sheet")
+        self._formats = {}
+        self._row = 0
+
+    def _format(self, color, num_format):
+        key = (color, num_format)
+        if key not in self._formats:
+            props = {}
+            if color is not None:
+                props.update(pattern=1, bg_color=f"#{color}")
+            if num_format is not None:
+                props["num_format"] = num_format
+            self._formats[key] = self._wb.add_format(props)
+        return self._formats[key]
+
+    def append(self, values, fills=None):
+        ws, r = self._ws, self._row
+        for c, v in enumerate(values):
+            color = fills.get(c) if fills else None
+            # 空值与 "" 同 openpyxl 一样不写值 (表头偏移的填充行保持为空行)，上色时只写格式
+            if v is None or v is pd.NaT or (isinstance(v, float) and v != v) or (isinstance(v, str) and v == ""):
+                if color is not None:
+                    ws.write_blank(r, c, None, self._format(color, None))
+            elif isinstance(v, str):
+                if color is None:
+                    ws.write_string(r, c, v)
+                else:
+                    ws.write_string(r, c, v, self._format(color, None))
+            elif isinstance(v, (bool, np.bool_)):
+                ws.write_boolean(r, c, bool(v), self._format(color, None) if color else None)
+            elif isinstance(v, (int, float, np.integer, np.floating)):
+                if color is None:
+                    ws.write_number(r, c, v)
+                else:
+                    ws.write_number(r, c, v, self._format(color, None))
+            elif isinstance(v, (dt.date, dt.time, dt.timedelta)):
+                num_format = next(f for t, f in self.NUMBER_FORMATS.items() if isinstance(v, t))
+                ws.write_datetime(r, c, v, self._format(color, num_format))
+            else:
+                ws.write_string(r, c, str(v), self._format(color, None) if color else None)
+        self._row += 1
+
+    def append_column(self, values, color=None):
+        """把 values 逐行写到第一列 (每行一个单元格)。"""
+        values = [None if v is None else str(v) for v in values]
+        self._ws.write_column(self._row, 0, values, self._format(color, None) if color else None)
+        self._row += len(values)
+
+    def save(self):
+        self._wb.close()
+        self._stream.seek(0)
+        return self._stream
+
+def _report_sheet():
+    if REPORT_EXCEL_ENGINE == "xlsxwriter":
+        return _XlsxwriterReportSheet()
+    return _OpenpyxlReportSheet()
+
+REPORT_FILENAMES = {
+    "full_report": "{}_审核标注版.xlsx",
+    "error_report": "{}_仅错误行_标红.xlsx",
+}
+
+class AuditReportWriter:
+    """
+    流式写出「审核标注版」与「仅错误行」两个文件：表头写出后可逐块追加行，
+    「仅错误行」文件在出现第一条错误行时才创建。full_report / error_report 为 False 时不写出该文件。
+    """
+
+    def __init__(self, sheet_name, columns, header_offset, contract_col_idx, reporter,
+                 full_report=True, error_report=True):
+        self.sheet_name = sheet_name
+        self.contract_col_idx = contract_col_idx
+        self.reporter = reporter
+        self.error_report = error_report
+        self._header = [
+            pd.Timestamp(v) if isinstance(v, np.datetime64) else v
+            for v in columns.values
+        ]
+        self._full_sheet = _report_sheet() if full_report else None
+        self._error_sheet = None
+        if self._full_sheet is not None:
+            for _ in range(header_offset):
+                self._full_sheet.append([""] * len(self._header))
+            self._full_sheet.append(self._header)
+
+    def write(self, df, errors, start=0):
+        """写出 df 的各行；df 第 i 行对应错误矩阵第 start + i 行。"""
+        row_has_error = errors.row_mask()
+        full_sheet = self._full_sheet
+        if full_sheet is None:
+            # 只写「仅错误行」：只取出有错误的行
+            if not self.error_report:
+                return
+            hits = np.flatnonzero(row_has_error[start:start + len(df)])
+            rows = zip(hits + start, df.iloc[hits].itertuples(index=False, name=None))
+        else:
+            rows = enumerate(df.itertuples(index=False, name=None), start=start)
+        for i, values in rows:
+            if not row_has_error[i]:
+                full_sheet.append(values)
+                continue
+            fills = dict.fromkeys(errors.error_columns(i).tolist(), RED_COLOR)
+            if self.error_report:
+                if self._error_sheet is None:
+                    self._error_sheet = _report_sheet()
+                    self._error_sheet.append(self._header)
+                self._error_sheet.append(values, fills)
+            if full_sheet is not None:
+                if self.contract_col_idx is not None:
+                    fills[self.contract_col_idx] = YELLOW_COLOR
+                full_sheet.append(values, fills)
+
+    def finish(self):
+        """保存并返回 files_dict (值为 (文件名, BytesIO))；未写出的文件为 (None, None)。"""
+        files_to_save = {"full_report": (None, None), "error_report": (None, None)}
+        if self._full_sheet is not None:
+            files_to_save["full_report"] = (
+                REPORT_FILENAMES["full_report"].format(self.sheet_name), self._full_sheet.save()
+            )
+
+        if self._error_sheet is not None:
+            try:
+                files_to_save["error_report"] = (
+                    REPORT_FILENAMES["error_report"].format(self.sheet_name), self._error_sheet.save()
+                )
+            except Exception as e:
+                self.reporter.error(f"❌ 生成“仅错误行”文件时出错: {e}")
+
+        return files_to_save
+
+def write_audit_reports(sheet_name, main_df, header_offset, errors, contract_col_idx, reporter, artifacts=None,
+                        lazy=None):
+    """
+    单次遍历同时写出「审核标注版」与「仅错误行」两个文件 (流式写入，不在内存中保留整张表)。
+    errors: ErrorMatrix，出错字段对应的单元格标红；有错误的行在合同列标黄。
+    artifacts: 结果文件存放的 ArtifactRun (默认保存在内存中)，按其设置 (或 lazy 给定的文件类型)
+    部分文件留到首次取用时再生成。
+    返回 files_dict，值为 (文件名, Artifact)。
+    """
+    artifacts = artifacts or ArtifactRun()
+    writer = artifacts.report_writer(sheet_name, main_df.columns, header_offset, contract_col_idx, reporter, lazy)
+    writer.write(main_df, errors)
+    return artifacts.finish_reports(writer, sheet_name, header_offset, errors, contract_col_idx, lazy)
+
+# =====================================
+# 🗄️ 结果文件存储：落盘保存，按需生成
+# =====================================
+class Artifact:
+    """
+    一个结果文件。落盘时只记录路径 (pickle、跨进程传递与结果缓存都只带路径)，
+    不落盘时直接持有字节。可按文件句柄 open() 或 getvalue() 取用。
+    """
+
+    def __init__(self, filename, path=None, data=None):
+        self.filename = filename
+        self.path = path
+        self.data = data
+
+    @property
+    def name(self):
+        return self.filename
+
+    def _resolve(self):
+        return self
+
+    def exists(self):
+        return self.data is not None or (self.path is not None and os.path.exists(self.path))
+
+    def open(self):
+        """只读二进制文件句柄 (调用方负责关闭)。"""
+        artifact = self._resolve()
+        if artifact.data is not None:
+            return BytesIO(artifact.data)
+        _touch(os.path.dirname(artifact.path))
+        return open(artifact.path, "rb")
+
+    def getvalue(self):
+        """文件全部字节 (与 BytesIO.getvalue 用法相同)。"""
+        artifact = self._resolve()
+        if artifact.data is not None:
+            return artifact.data
+        with artifact.open() as fh:
+            return fh.read()
+
+    def write_to(self, path):
+        """写到 path (落盘的文件直接复制)。"""
+        artifact = self._resolve()
+        if artifact.data is not None:
+            with open(path, "wb") as fh:
+                fh.write(artifact.data)
+        else:
+            shutil.copyfile(artifact.path, path)
+
+def _touch(path):
+    # 刷新访问时间，供 ArtifactStore 按最近使用淘汰
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+class LazyReport(Artifact):
+    """
+    首次取用时才生成的审核结果文件：保存主表来源 (source，同一次审核落盘的主表副本)、
+    sheet 与错误矩阵，生成时重新读取该 sheet 并按错误矩阵标注，生成后落盘复用。
+    """
+
+    def __init__(self, filename, kind, run, sheet_name, header_offset, errors, contract_col_idx):
+        super().__init__(filename)
+        self.kind = kind    # "full_report" / "error_report"
+        self.run = run
+        self.sheet_name = sheet_name
+        self.header_offset = header_offset
+        self.errors = errors
+        self.contract_col_idx = contract_col_idx
+        self._built = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def materialized(self):
+        return self._built is not None and self._built.exists()
+
+    def exists(self):
+        return self.materialized or self.run.source.exists()
+
+    def materialize(self, reporter=None):
+        """生成并落盘 (已生成时直接返回)，返回生成的 Artifact；生成耗时记入 reporter 的性能剖析。"""
+        with self._lock:
+            if not self.materialized:
+                reporter = reporter or AuditReporter()
+                with reporter.stage("按需生成结果文件", self.sheet_name):
+                    self._built = self._build()
+            return self._built
+
+    def _resolve(self):
+        return self.materialize()
+
+    def _build(self):
+        reporter = AuditReporter()
+        store = WorkbookStore(self.run.source)
+        writer_args = dict(full_report=self.kind == "full_report", error_report=self.kind == "error_report")
+        chunk_rows = self.run.chunk_rows
+        if chunk_rows > 0:
+            with tempfile.TemporaryDirectory(prefix="audit_chunks_") as spill_dir:
+                sheet = store.chunked(self.sheet_name, self.header_offset, chunk_rows, spill_dir)
+                if sheet is not None:
+                    writer = AuditReportWriter(self.sheet_name, sheet.columns, self.header_offset,
+                                               self.contract_col_idx, reporter, **writer_args)
+                    for df in sheet.frames():
+                        writer.write(df, self.errors, df.index[0])
+                    return self.run.put(*writer.finish()[self.kind])
+        main_df = store.frame(self.sheet_name, header=self.header_offset)
+        writer = AuditReportWriter(self.sheet_name, main_df.columns, self.header_offset,
+                                   self.contract_col_idx, reporter, **writer_args)
+        writer.write(main_df, self.errors)
+        return self.run.put(*writer.finish()[self.kind])
+
+class ArtifactRun:
+    """
+    一次审核的结果文件：run_dir 为 None 时保存在内存中，否则写入 run_dir (ArtifactStore 的子目录)。
+    source 为主表副本 (按需生成的文件从它重新读取)，lazy 为留到首次取用时才生成的文件类型。
+    """
+
+    def __init__(self, run_dir=None, lazy=(), chunk_rows=0):
+        self.run_dir = run_dir
+        self.lazy = tuple(lazy)
+        self.chunk_rows = chunk_rows
+        self.source = None
+
+    def put(self, filename, stream):
+        """保存一个已生成的文件 (BytesIO 或 bytes)，返回 Artifact。"""
+        data = stream.getvalue() if hasattr(stream, "getvalue") else bytes(stream)
+        if self.run_dir is None:
+            return Artifact(filename, data=data)
+        path = os.path.join(self.run_dir, filename)
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return Artifact(filename, path=path)
+
+    def put_source(self, file):
+        """保存主表副本，返回 Artifact (同时可作 WorkbookStore 的输入)。"""
+        name = os.path.basename(getattr(file, "name", "main.xlsx"))
+        data = _read_file_bytes(file)
+        if self.run_dir is None:
+            self.source = Artifact(name, data=data)
+        else:
+            # 放在子目录中，不与结果文件重名
+            os.makedirs(os.path.join(self.run_dir, "inputs"), exist_ok=True)
+            path = os.path.join(self.run_dir, "inputs", name)
+            with open(path, "wb") as fh:
+                fh.write(data)
+            self.source = Artifact(name, path=path)
+        return self.source
+
+    def report_writer(self, sheet_name, columns, header_offset, contract_col_idx, reporter, lazy=None):
+        """审核时即写出的结果文件的写出器 (按需生成的文件不写；lazy 默认为本次审核的设置)。"""
+        lazy = self.lazy if lazy is None else lazy
+        return AuditReportWriter(
+            sheet_name, columns, header_offset, contract_col_idx, reporter,
+            full_report="full_report" not in lazy, error_report="error_report" not in lazy,
+        )
+
+    def finish_reports(self, writer, sheet_name, header_offset, errors, contract_col_idx, lazy=None):
+        """保存写出器的结果，按需生成的文件换成 LazyReport；返回 files_dict。"""
+        lazy = self.lazy if lazy is None else lazy
+        files_dict = {}
+        for kind, (filename, stream) in writer.finish().items():
+            if kind not in lazy:
+                files_dict[kind] = (filename, None if stream is None else self.put(filename, stream))
+            elif kind == "error_report" and errors.total == 0:
+                files_dict[kind] = (None, None)  # 与即时写出一致：没有错误行时不生成
+            else:
+                filename = REPORT_FILENAMES[kind].format(sheet_name)
+                files_dict[kind] = (filename, LazyReport(
+                    filename, kind, self, sheet_name, header_offset, errors, contract_col_idx,
+                ))
+        return files_dict
+
+    def adopt_reports(self, files_dict):
+        """沿用上次审核的结果文件：落盘文件链接 (或复制) 到本次目录，未生成的文件改从本次的主表副本生成。"""
+        adopted = {}
+        for kind, (filename, artifact) in files_dict.items():
+            if artifact is None:
+                adopted[kind] = (filename, None)
+            elif isinstance(artifact, LazyReport) and not artifact.materialized:
+                adopted[kind] = (filename, LazyReport(
+                    filename, artifact.kind, self, artifact.sheet_name, artifact.header_offset,
+                    artifact.errors, artifact.contract_col_idx,
+                ))
+            else:
+                adopted[kind] = (filename, self._link(artifact._resolve()))
+        return adopted
+
+    def _link(self, artifact):
+        if self.run_dir is None or artifact.path is None:
+            return self.put(artifact.filename, artifact.getvalue())
+        path = os.path.join(self.run_dir, artifact.filename)
+        try:
+            os.link(artifact.path, path)
+        except OSError:
+            shutil.copyfile(artifact.path, path)
+        return Artifact(artifact.filename, path=path)
+
+def files_available(files_dict):
+    """files_dict 中的结果文件是否都还能取用 (落盘文件可能已被 ArtifactStore 清理)。"""
+    return all(artifact.exists() for _, artifact in files_dict.values() if artifact is not None)
+
+class ArtifactStore:
+    """结果文件落盘存储：每次审核一个子目录，超过 max_runs 个时删除最久未使用的目录。"""
+
+    def __init__(self, root, max_runs=AUDIT_ARTIFACT_MAX_RUNS):
+        self.root = root
+        self.max_runs = max_runs
+        os.makedirs(root, exist_ok=True)
+
+    def new_run(self, lazy=(), chunk_rows=0):
+        self._evict(keep=self.max_runs - 1)
+        run_dir = os.path.join(self.root, f"run_{uuid.uuid4().hex}")
+        os.makedirs(run_dir)
+        return ArtifactRun(run_dir, lazy, chunk_rows)
+
+    def _evict(self, keep):
+        runs = sorted(
+            (e for e in os.scandir(self.root) if e.is_dir() and e.name.startswith("run_")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entry in runs[:max(0, len(runs) - keep)]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+_default_artifact_store = None
+_default_artifact_lock = threading.Lock()
+
+def default_artifact_store():
+    """
+    AUDIT_ARTIFACT_DIR (未设置时为 AUDIT_CACHE_DIR/artifacts) 下的存储；都未设置时为进程内共用的临时目录，
+    进程退出时删除。
+    """
+    global _default_artifact_store
+    with _default_artifact_lock:
+        if _default_artifact_store is None:
+            root = AUDIT_ARTIFACT_DIR or (os.path.join(AUDIT_CACHE_DIR, "artifacts") if AUDIT_CACHE_DIR else None)
+            if root is None:
+                root = tempfile.mkdtemp(prefix="audit_artifacts_")
+                atexit.register(shutil.rmtree, root, ignore_errors=True)
+            _default_artifact_store = ArtifactStore(root)
+        return _default_artifact_store
+
+def lazy_report_kinds(setting=AUDIT_LAZY_REPORTS):
+    """AUDIT_LAZY_REPORTS 设置 -> 按需生成的文件类型。"""
+    kinds = {"0": (), "full": ("full_report",), "all": ("full_report", "error_report")}
+    if str(setting) not in kinds:
+        raise ValueError(f"AUDIT_LAZY_REPORTS 设置 '{setting}' 无效，可选: {', '.join(kinds)}")
+    return kinds[str(setting)]
+
+# =====================================
+# 🕵️ (新) 漏填检查函数
+# =====================================
+class ContractCoverage:
+    """
+    提成 sheet 合同在各检查 sheet 中的覆盖位图：行为提成 sheet 的合同 (按编码排序去重)，
+    每个检查 sheet 一个比特面 (布尔列)。漏填合同、各合同出现在哪些 sheet 均由整列归约得到。
+    """
+
+    def __init__(self, codes, contracts, sheet_names, planes):
+        self.codes = codes              # 提成 sheet 合同编码 (ContractKeys)，升序
+        self.contracts = contracts      # 对应的归一化合同号
+        self.sheet_names = sheet_names
+        self.planes = planes            # (合同数, sheet 数) 布尔矩阵
+
+    @classmethod
+    def build(cls, commission_codes, sheet_contracts, keys):
+        """
+        commission_codes: 提成 sheet 的合同编码；sheet_contracts: {sheet 名: 该 sheet 出现的合同编码}；
+        keys: 编码所用的 ContractKeys。
+        """
+        codes = np.unique(commission_codes)
+        planes = np.zeros((len(codes), len(sheet_contracts)), dtype=bool)
+        for j, contracts in enumerate(sheet_contracts.values()):
+            if len(codes) == 0 or len(contracts) == 0:
+                continue
+            # 有序查找：只标记提成 sheet 中存在的合同，其余编码忽略
+            pos = np.minimum(np.searchsorted(codes, contracts), len(codes) - 1)
+            planes[pos[codes[pos] == contracts], j] = True
+        return cls(codes, keys.decode(codes), list(sheet_contracts), planes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def covered(self):
+        """各合同是否出现在任一检查 sheet。"""
+        return self.planes.any(axis=1)
+
+    def missing(self):
+        """所有检查 sheet 都未出现的合同号 (升序)。"""
+        return np.sort(self.contracts[~self.covered()])
+
+    def sheet_labels(self):
+        """各合同出现的 sheet，以“、”连接 (未出现为空串)；按不同的覆盖组合各拼接一次。"""
+        combos, inverse = np.unique(self.planes, axis=0, return_inverse=True)
+        names = np.asarray(self.sheet_names, dtype=object)
+        labels = np.array(["、".join(names[row]) for row in combos], dtype=object)
+        return labels[inverse.reshape(-1)] if len(self) else np.empty(0, dtype=object)
+
+    def summary_frame(self):
+        """各 sheet 覆盖的提成合同数，以及只在该 sheet 出现的合同数。"""
+        only_here = self.planes & (self.planes.sum(axis=1) == 1)[:, None]
+        return pd.DataFrame({
+            "sheet": self.sheet_names,
+            "覆盖合同数": self.planes.sum(axis=0),
+            "仅在此 sheet": only_here.sum(axis=0),
+        })
+
+    def frame(self):
+        """每个提成合同一行：合同号、出现的 sheet 数与 sheet 名。"""
+        return pd.DataFrame({
+            "合同号": self.contracts,
+            "出现sheet数": self.planes.sum(axis=1),
+            "出现的sheet": self.sheet_labels(),
+        })
+
+def run_leaky_check(commission_df, contract_col_comm, sheet_contracts, keys, reporter, artifacts=None):
+    """
+    执行漏填检查，返回 (漏填合同数, files_dict, ContractCoverage)。
+    sheet_contracts 为 {检查 sheet: 该 sheet 出现的合同编码} (keys 为 ContractKeys)；
+    artifacts 为结果文件存放的 ArtifactRun (默认保存在内存中)。
+    """
+    reporter.subheader("📋 合同漏填检测结果（基于提成sheet）")
+    files_to_save = {}
+    
+    if commission_df is None or contract_col_comm is None:
+        reporter.warning("⚠️ 未加载“提成”sheet或未找到合同列，跳过漏填检查。")
+        return 0, {}, None
+
+    coverage = ContractCoverage.build(
+        keys.encode(commission_df[contract_col_comm].dropna()), sheet_contracts, keys
+    )
+    missing_contracts = coverage.missing()
+    漏填合同数 = len(missing_contracts)
+
+    reporter.write(f"共 {漏填合同数} 个合同在所有检查表中未出现。")
+
+    if 漏填合同数:
+        # 与审核结果文件相同的流式写出器，整列一次写出
+        sheet = _report_sheet()
+        sheet.append(["未出现在任一表中的合同号"])
+        sheet.append_column(missing_contracts, YELLOW_COLOR)
+        files_to_save["leaky_list"] = (
+            "漏填合同号列表.xlsx", (artifacts or ArtifactRun()).put("漏填合同号列表.xlsx", sheet.save())
+        )
+    
+    else:
+        reporter.success("✅ 所有提成sheet合同号均已出现在检查表中，无漏填。")
+        
+    return 漏填合同数, files_to_save, coverage
+
+# =====================================
+# 📚 参考文件读取与预处理 (可跨月份复用)
+# =====================================
+# 参考文件只读取合同列与比对所需列
+# 各参考源需要读取的列 (规则文件 references 中声明的列，加上规则引用到的列)
+REFERENCE_COLUMNS = AUDIT_RULES.reference_columns
+
+class ReferenceTable:
+    """单个参考文件的读取与预处理结果 (不含工作簿对象，可 pickle 后传给子进程)。"""
+
+    def __init__(self, raw_df, contract_col, std_df, parse_counts, parse_seconds):
+        self.raw_df = raw_df            # 只含合同列与所需列的原始数据 (fk 即“提成”sheet 合集)
+        self.contract_col = contract_col
+        self.std_df = std_df            # prepare_one_ref_df 的结果
+        self.parse_counts = parse_counts
+        self.parse_seconds = parse_seconds
+
+def read_reference_rows(prefix, store, reporter, tails=None):
+    """
+    读取参考文件所需列的单元格行：ec/product 取第一个 sheet，fk 拼接所有“提成”sheet。
+    tails 为上次读取同一参考源的 column_tails 时只读取末尾追加的行 (不是只追加了行时返回 None)。
+    """
+    cols = REFERENCE_COLUMNS[prefix]
+    if prefix == "fk":
+        sheets = [s for s in store.sheet_names if "提成" in s]
+        if not sheets:
+            raise ValueError("在 '放款明细' 文件中未找到任何包含 '提成' 的sheet")
+        if tails is None:
+            reporter.info(f"ℹ️ 正在从 '放款明细' 加载 {len(sheets)} 个 '提成' sheet...")
+    else:
+        sheets = store.sheet_names[:1]
+    with reporter.stage(f"解析参考文件 ({prefix})") as st:
+        if tails is None:
+            column_rows = store.read_column_rows(sheets, ["合同"] + cols)
+        else:
+            column_rows = store.read_appended_rows(sheets, ["合同"] + cols, tails)
+        if column_rows is not None:
+            st.rows = sum(max(len(s["rows"]) - 1, 0) for s in column_rows["sheets"])
+    return column_rows
+
+def build_reference(prefix, column_rows, store, reporter):
+    """由单元格行构建原始数据并预处理为标准参考表，返回 (ReferenceTable, 各 sheet 的原始数据)。"""
+    with reporter.stage(f"预处理参考表 ({prefix})") as st:
+        sheet_frames = column_sheet_frames(column_rows)
+        raw_df = concat_sheet_frames(sheet_frames, column_rows["wanted"])
+        contract_col = find_col(raw_df, "合同")
+        std_df = prepare_one_ref_df(raw_df, contract_col, REFERENCE_COLUMNS[prefix], prefix, reporter)
+        st.rows = len(raw_df)
+    table = ReferenceTable(raw_df, contract_col, std_df, dict(store.parse_counts), dict(store.parse_seconds))
+    return table, sheet_frames
+
+def append_reference(prefix, base, base_frames, column_rows, store, reporter):
+    """
+    在上次的参考表 base (各 sheet 原始数据为 base_frames) 之后接上 column_rows
+    (read_appended_rows 的结果) 中的新增行：只解析新增行、只归一化新增行的合同键，
+    标准参考表按原始行号合并去重，结果与整表读取相同。
+    返回 (ReferenceTable, 各 sheet 的原始数据)；列类型需整列重新推断时返回 None。
+    """
+    with reporter.stage(f"预处理参考表 ({prefix})") as st:
+        sheet_frames, old_starts, shifts, tail_pos = [], [], [], []
+        old_start = new_start = 0
+        for old_df, sheet in zip(base_frames, column_rows["sheets"]):
+            df = old_df
+            if len(sheet["rows"]) > 1:
+                df = append_sheet_frame(old_df, sheet["rows"])
+                if df is None:
+                    return None
+            sheet_frames.append(df)
+            old_starts.append(old_start)
+            shifts.append(new_start - old_start)
+            tail_pos.append(np.arange(new_start + len(old_df), new_start + len(df)))
+            old_start += len(old_df)
+            new_start += len(df)
+        raw_df = concat_sheet_frames(sheet_frames, column_rows["wanted"])
+        contract_col = find_col(raw_df, "合同")
+        if contract_col is None or contract_col != base.contract_col:
+            return None
+        tail_pos = np.concatenate(tail_pos) if tail_pos else np.array([], dtype=np.intp)
+
+        # 上次的标准参考表以原始行号为索引：换算为追加后的行号，与新增行一起按行号排序，
+        # 每个合同键的首行必在其中，去重保留首行即与整表预处理相同
+        std_df = base.std_df
+        if len(tail_pos):
+            old_pos = std_df.index.to_numpy(dtype=np.intp)
+            sheet_idx = np.searchsorted(np.asarray(old_starts), old_pos, side="right") - 1
+            positions = np.concatenate([old_pos + np.asarray(shifts)[sheet_idx], tail_pos])
+            keys = np.concatenate([
+                std_df['__KEY__'].to_numpy(dtype=object),
+                normalize_contract_key(raw_df[contract_col].iloc[tail_pos]).to_numpy(dtype=object),
+            ])
+            order = np.argsort(positions, kind="stable")
+            std_df = prepare_one_ref_df(
+                raw_df.iloc[positions[order]], contract_col, REFERENCE_COLUMNS[prefix], prefix, reporter,
+                keys=keys[order],
+            )
+        st.rows = len(tail_pos)
+    table = ReferenceTable(raw_df, contract_col, std_df, dict(store.parse_counts), dict(store.parse_seconds))
+    return table, sheet_frames
+
+def load_reference(prefix, file, reporter):
+    """读取并预处理一个参考文件。"""
+    store = WorkbookStore(file, engine=REFERENCE_EXCEL_ENGINE)
+    return build_reference(prefix, read_reference_rows(prefix, store, reporter), store, reporter)[0]
+
+# =====================================
+# 💾 参考快照 (本地持久化)
+# =====================================
+def _frames_identical(a, b):
+    """逐列比较取值、dtype 与 object 列的元素类型，用于确认 Arrow 往返无损。"""
+    if not (a.columns.equals(b.columns) and a.index.equals(b.index)
+            and a.index.dtype == b.index.dtype and list(a.dtypes) == list(b.dtypes)):
+        return False
+    for i in range(a.shape[1]):
+        x, y = a.iloc[:, i], b.iloc[:, i]
+        if x.dtype == object and list(map(type, x)) != list(map(type, y)):
+            return False
+        if not x.equals(y):
+            return False
+    return True
+
+def _arrow_column_ok(series):
+    """单列能否经 Arrow 无损往返 (取值、dtype、object 元素类型均不变)。"""
+    one = series.to_frame(name="v").reset_index(drop=True)
+    try:
+        back = pa.Table.from_pandas(one, preserve_index=False).to_pandas()
+    except (pa.ArrowException, TypeError, ValueError):
+        return False
+    return _frames_identical(one, back)
+
+def save_frame(df, path_base):
+    """
+    保存 DataFrame：能经 Arrow 无损往返的列写入 <path_base>.arrow (加载时内存映射)，
+    其余列 (如混合类型的 object 列) 与索引、列名一起写入 <path_base>.pkl。
+    未安装 pyarrow 时全部写入 pickle。
+    """
+    arrow_pos = []
+    if pa is not None:
+        arrow_pos = [i for i in range(df.shape[1]) if _arrow_column_ok(df.iloc[:, i])]
+    if arrow_pos:
+        table = pa.Table.from_pandas(
+            pd.DataFrame({f"c{i}": df.iloc[:, i].array for i in arrow_pos}), preserve_index=False
+        )
+        with pa.OSFile(path_base + ".arrow", "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    rest = {
+        "index": df.index,
+        "columns": df.columns,
+        "arrow": arrow_pos,
+        "other": {i: df.iloc[:, i].array for i in range(df.shape[1]) if i not in arrow_pos},
+    }
+    with open(path_base + ".pkl", "wb") as fh:
+        pickle.dump(rest, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_frame(path_base):
+    with open(path_base + ".pkl", "rb") as fh:
+        rest = pickle.load(fh)
+    arrays = dict(rest["other"])
+    if rest["arrow"]:
+        if pa is None:
+            raise ValueError("快照含 Arrow 文件，但未安装 pyarrow")
+        arrow_df = pa.ipc.open_file(pa.memory_map(path_base + ".arrow")).read_all().to_pandas()
+        for i in rest["arrow"]:
+            arrays[i] = arrow_df[f"c{i}"].array
+    df = pd.DataFrame({i: arrays[i] for i in range(len(rest["columns"]))})
+    df.index = rest["index"]
+    df.columns = rest["columns"]
+    return df
+
+class ReferenceSnapshotStore:
+    """
+    参考表本地快照：按 (参考类型, 源文件内容摘要) 保存读取与预处理结果，
+    同一文件再次上传时直接加载 (Arrow 文件内存映射)，不再解析 Excel。
+    新文件若只是在旧快照对应文件的末尾追加了行 (表头与原末行不变)，只转换、预处理新增行，
+    接在旧快照的各 sheet 原始数据与标准参考表之后 (见 append_reference)。
+    快照目录: <root>/<参考类型>-<规格摘要>/<文件摘要>/，规格含读取引擎与所需列，变化后自动隔离；
+    目录中为各 sheet 原始数据 (sheet<i>)、标准参考表 (std)、各 sheet 表头、末行与原有行指纹 (tails.pkl) 与 meta.json。
+    """
+
+    # 2: 标准参考表改为紧凑列类型 (Arrow 字符串合同键、category 文本列)
+    # 3: 原始数据按 sheet 分别保存，以表头与末行 (tails.pkl) 代替全部单元格行
+    # 4: tails.pkl 增加末行之前各行的指纹
+    FORMAT_VERSION = 4
+
+    def __init__(self, root_dir, max_entries=REFERENCE_SNAPSHOT_MAX_ENTRIES):
+        self.root_dir = root_dir
+        self.max_entries = max_entries
+
+    def _spec_dir(self, prefix):
+        spec = f"{self.FORMAT_VERSION}|{REFERENCE_EXCEL_ENGINE}|{REFERENCE_COLUMNS[prefix]}"
+        return os.path.join(self.root_dir, f"{prefix}-{hashlib.sha256(spec.encode()).hexdigest()[:12]}")
+
+    def _entries(self, prefix):
+        """已完成的快照目录，最近使用的在前。"""
+        spec_dir = self._spec_dir(prefix)
+        if not os.path.isdir(spec_dir):
+            return []
+        entries = [
+            e for e in os.scandir(spec_dir)
+            if e.is_dir() and os.path.exists(os.path.join(e.path, "meta.json"))
+        ]
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        return [e.path for e in entries]
+
+    def load(self, prefix, file, reporter):
+        digest = file_digest(file)
+        entry = os.path.join(self._spec_dir(prefix), digest)
+        try:
+            with reporter.stage(f"加载参考快照 ({prefix})") as st:
+                table = self._load_entry(entry)[0]
+                st.rows = len(table.raw_df)
+            os.utime(entry, None)
+            reporter.write(f"⚡ 参考文件「{file.name}」命中本地快照，跳过 Excel 解析。")
+            return table
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            # 不存在或已损坏/格式过期：清掉后重建
+            shutil.rmtree(entry, ignore_errors=True)
+
+        store = WorkbookStore(file, engine=REFERENCE_EXCEL_ENGINE)
+        result = self._append_latest(prefix, file, store, reporter)
+        if result is None:
+            column_rows = read_reference_rows(prefix, store, reporter)
+            result = build_reference(prefix, column_rows, store, reporter) + (column_tails(column_rows),)
+        table, sheet_frames, tails = result
+        try:
+            self._save_entry(entry, table, sheet_frames, tails)
+            self._prune(prefix)
+        except OSError as e:
+            reporter.warning(f"⚠️ 写入参考快照失败：{e}")
+        return table
+
+    def _append_latest(self, prefix, file, store, reporter):
+        """
+        最近使用的快照对应文件若只在末尾追加了行，在其基础上只读取新增行，
+        返回 (ReferenceTable, 各 sheet 原始数据, tails)；否则返回 None。
+        """
+        entries = self._entries(prefix)
+        if not entries:
+            return None
+        try:
+            with open(os.path.join(entries[0], "tails.pkl"), "rb") as fh:
+                tails = pickle.load(fh)
+            column_rows = read_reference_rows(prefix, store, reporter, tails)
+            if column_rows is None:
+                return None
+            base, base_frames = self._load_entry(entries[0])
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            return None
+        result = append_reference(prefix, base, base_frames, column_rows, store, reporter)
+        if result is None:
+            return None
+        added = sum(len(s["rows"]) - 1 for s in column_rows["sheets"])
+        reporter.write(
+            f"🧩 参考文件「{file.name}」在快照基础上追加读取 {added} 行"
+            f"（复用 {len(base.raw_df)} 行）。"
+        )
+        return result + (column_tails(column_rows, tails),)
+
+    def _load_entry(self, entry):
+        """返回 (ReferenceTable, 各 sheet 原始数据)。"""
+        with open(os.path.join(entry, "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta["format"] != self.FORMAT_VERSION:
+            raise ValueError("snapshot format changed")
+        sheet_frames = [load_frame(os.path.join(entry, f"sheet{i}")) for i in range(len(meta["sheets"]))]
+        raw_df = concat_sheet_frames(sheet_frames, meta["wanted"])
+        std_df = load_frame(os.path.join(entry, "std"))
+        return ReferenceTable(raw_df, meta["contract_col"], std_df, {}, {}), sheet_frames
+
+    def _save_entry(self, entry, table, sheet_frames, tails):
+        # 先写到临时目录，完成后整体改名，避免并发读到半成品
+        spec_dir = os.path.dirname(entry)
+        os.makedirs(spec_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=spec_dir)
+        for i, df in enumerate(sheet_frames):
+            save_frame(df, os.path.join(tmp, f"sheet{i}"))
+        save_frame(table.std_df, os.path.join(tmp, "std"))
+        with open(os.path.join(tmp, "tails.pkl"), "wb") as fh:
+            pickle.dump(tails, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {
+            "format": self.FORMAT_VERSION,
+            "contract_col": table.contract_col,
+            "wanted": tails["wanted"],
+            "sheets": {s["name"]: s["rows"] for s in tails["sheets"]},
+            "created": time.time(),
+        }
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # 其他进程已写入同一快照
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _prune(self, prefix):
+        for entry in self._entries(prefix)[self.max_entries:]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+def default_snapshot_store():
+    """按 REFERENCE_SNAPSHOT_DIR 配置返回快照存储，未配置时返回 None。"""
+    return ReferenceSnapshotStore(REFERENCE_SNAPSHOT_DIR) if REFERENCE_SNAPSHOT_DIR else None
+
+class ReferenceCache:
+    """
+    按 (参考类型, 文件内容摘要) 复用已预处理的参考表。
+    批量审核多个月份时，各月共用的参考文件只读取、预处理一次；
+    给定 snapshots (ReferenceSnapshotStore) 时，未命中的参考文件先经本地快照加载。
+    """
+
+    def __init__(self, snapshots=None):
+        self.snapshots = snapshots
+        self._tables = {}
+
+    def get(self, prefix, file, reporter):
+        key = (prefix, file_digest(file))
+        if key not in self._tables:
+            if self.snapshots is not None:
+                self._tables[key] = self.snapshots.load(prefix, file, reporter)
+            else:
+                self._tables[key] = load_reference(prefix, file, reporter)
+        else:
+            reporter.write(f"♻️ 参考文件「{file.name}」内容未变，复用已预处理结果。")
+        return self._tables[key]
+
+    def __len__(self):
+        return len(self._tables)
+
+# =====================================
+# 🧵 单 sheet 审核任务 (顺序执行与进程池共用)
+# =====================================
+AUDIT_PROGRESS_KEY = "全部 sheet"
+
+def audit_one_sheet(sheet_name, main_store, ref_lookup, rules, reporter, baseline=None, chunk_rows=0,
+                    artifacts=None):
+    """
+    审核单个 sheet，返回可跨进程传递的结果 (不含主表 DataFrame)：
+    (错误矩阵, files_dict, 该 sheet 出现的合同编码 (ref_lookup.keys), SheetAuditState)；未找到合同列时返回 None。
+    files_dict 的值为 (文件名, Artifact)，文件存放在 artifacts (ArtifactRun，默认保存在内存中)。
+    chunk_rows > 0 时按块流式审核 (结果与整表审核相同)。
+    """
+    if chunk_rows > 0:
+        with tempfile.TemporaryDirectory(prefix="audit_chunks_") as spill_dir:
+            with reporter.stage("分块读取主表", sheet_name) as st:
+                header_offset = get_header_row(main_store, sheet_name)
+                sheet = main_store.chunked(sheet_name, header_offset, chunk_rows, spill_dir)
+                st.rows = sheet.n_rows if sheet is not None else 0
+            if sheet is not None:
+                return audit_sheet_stream(
+                    sheet_name, sheet, header_offset, ref_lookup, rules, reporter, baseline, artifacts
+                )
+        # 空表等无法分块的 sheet 退回整表审核
+
+    return audit_sheet_vec(sheet_name, main_store, ref_lookup, rules, reporter, baseline, artifacts)
+
+# 子进程内的只读状态：由 _init_sheet_worker 在进程启动时加载一次
+_worker_state = {}
+
+def _init_sheet_worker(snapshot_path):
+    with open(snapshot_path, "rb") as fh:
+        artifacts, ref_lookup, rules, chunk_rows, profile = pickle.load(fh)
+    _worker_state.update(
+        # 主表从本次审核落盘的副本读取；结果文件直接写入同一目录，只把路径传回主进程
+        main_store=WorkbookStore(artifacts.source),
+        artifacts=artifacts,
+        ref_lookup=ref_lookup,
+        rules=rules,
+        chunk_rows=chunk_rows,
+        profile=profile,
+    )
+
+def _audit_sheet_task(sheet_name, baseline):
+    reporter = BufferedReporter()
+    # 子进程的剖析记录随 reporter 带回，replay 时并入主进程的 profiler
+    reporter.profiler = AuditProfiler.from_setting(_worker_state["profile"])
+    main_store = _worker_state["main_store"]
+    with reporter.stage("审核 sheet", sheet_name):
+        result = audit_one_sheet(
+            sheet_name, main_store, _worker_state["ref_lookup"], _worker_state["rules"], reporter,
+            baseline, _worker_state["chunk_rows"], _worker_state["artifacts"],
+        )
+    if reporter.profiler is not None:
+        reporter.profiler.finish()
+    parse_stats = main_store.parse_counts.get(sheet_name, 0), main_store.parse_seconds.get(sheet_name, 0.0)
+    return result, reporter, parse_stats
+
+def format_parse_summary(sources):
+    """
+    sources: [(文件标签, {sheet: 解析次数}, {sheet: 解析耗时})]，同一文件同名 sheet 的次数合计
+    (并行审核时主进程与子进程各自计数)。返回解析统计的说明文字，列出被解析多次的 sheet。
+    """
+    counts, seconds = {}, 0.0
+    for label, sheet_counts, sheet_seconds in sources:
+        for sheet_name, n in sheet_counts.items():
+            counts[(label, sheet_name)] = counts.get((label, sheet_name), 0) + n
+        seconds += sum(sheet_seconds.values())
+    text = (f"📖 共解析 {len(counts)} 个 sheet（单个 sheet 最多解析 {max(counts.values(), default=0)} 次），"
+            f"耗时 {seconds:.2f} 秒")
+    repeated = [f"{label}/{sheet_name} ×{n}" for (label, sheet_name), n in counts.items() if n > 1]
+    if repeated:
+        text += "；重复解析: " + "、".join(repeated)
+    return text + "。"
+
+def audit_sheets_parallel(target_sheets, main_store, ref_lookup, rules, reporter, workers,
+                          baselines=None, chunk_rows=0, artifacts=None):
+    """
+    把各 sheet 分发到进程池审核 (baselines: {sheet: 上次的 SheetAuditState}，随任务传入)。
+    参考查找表先归一化所用的参考列 (RefLookup.warm_views)，再只写一次临时快照，
+    每个子进程启动时加载一次 (只读共享，不随任务重复传输)；
+    主表由子进程从 artifacts (ArtifactRun) 中的主表副本读取，未落盘时随快照传入；
+    子进程的消息先缓冲，任务完成时在主进程 replay，总进度随任务完成更新。
+    返回 (按 target_sheets 顺序排列的结果列表, {sheet: (子进程解析次数, 解析耗时)})。
+    """
+    results, parse_stats = {}, {}
+    profiler = reporter.profiler
+    profile = "0" if profiler is None else ("memory" if profiler.memory else "1")
+    shared_keys = len(ref_lookup.keys)
+    if artifacts is None or artifacts.source is None:
+        artifacts = artifacts or ArtifactRun()
+        main_file = BytesIO(main_store._data)
+        main_file.name = main_store.name
+        artifacts.put_source(main_file)
+    with reporter.stage("归一化参考列", rows=len(ref_lookup.table)):
+        ref_lookup.warm_views(rules)
+    with tempfile.TemporaryDirectory(prefix="audit_") as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, "snapshot.pkl")
+        with open(snapshot_path, "wb") as fh:
+            pickle.dump(
+                (artifacts, ref_lookup, rules, chunk_rows, profile),
+                fh, protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+        reporter.progress(AUDIT_PROGRESS_KEY, 0)
+        reporter.status(AUDIT_PROGRESS_KEY, f"已分发 {len(target_sheets)} 个 sheet 到 {workers} 个进程...")
+        # spawn：Streamlit 服务进程是多线程的，fork 不安全
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_sheet_worker,
+            initargs=(snapshot_path,),
+        ) as pool:
+            baselines = baselines or {}
+            futures = {pool.submit(_audit_sheet_task, s, baselines.get(s)): s for s in target_sheets}
+            for done, future in enumerate(as_completed(futures), start=1):
+                sheet_name = futures[future]
+                result, sheet_reporter, stats = future.result()
+                sheet_reporter.replay(reporter)
+                if result is not None:
+                    # 子进程新增的合同编码不在主进程的字典中 (也就不是提成 sheet 的合同)，丢弃
+                    errors, files_dict, contracts, state = result
+                    result = errors, files_dict, contracts[contracts < shared_keys], state
+                results[sheet_name] = result
+                parse_stats[sheet_name] = stats
+                reporter.progress(AUDIT_PROGRESS_KEY, done / len(target_sheets))
+                reporter.status(AUDIT_PROGRESS_KEY, f"已完成 {done}/{len(target_sheets)} 个 sheet")
+
+    return [results[s] for s in target_sheets], parse_stats
+
+# =====================================
+# 🚀 (新) 审核主函数
+# =====================================
+def run_full_audit(uploaded_files, reporter=None, workers=None, ref_cache=None, baseline=None,
+                   chunk_rows=None, profile=None, artifacts=None, lazy_reports=None):
+    """
+    执行所有文件读取、预处理和检查，并返回所有结果 (结果文件为 [(文件名, Artifact)])。
+    reporter: 消息与进度输出 (默认不输出)；workers: 并行进程数 (默认 AUDIT_WORKERS，<= 1 为顺序执行)；
+    ref_cache: 可选 ReferenceCache，批量审核时在多次调用间共用；
+    baseline: 上次审核返回的 stats["audit_state"]，给出时只重新比对变化的行，
+    有变化的 sheet 的结果文件都留到首次取用时生成 (lazy_reports=() 时除外)；
+    chunk_rows: 流式分块审核的块大小 (默认 AUDIT_CHUNK_ROWS，0 为整表审核)；
+    profile: 性能剖析设置 (默认 AUDIT_PROFILE)，开启时 stats["profile"] 为 AuditProfiler，否则为 None；
+    artifacts: 结果文件落盘的 ArtifactStore (默认 default_artifact_store())；
+    lazy_reports: 留到首次取用时才生成的文件类型 (如 ("full_report",)，默认按 AUDIT_LAZY_REPORTS)，
+    () 为审核时全部生成 (计入本次审核的耗时与性能剖析)。
+    """
+    reporter = reporter or AuditReporter()
+    profiler = AuditProfiler.from_setting(AUDIT_PROFILE if profile is None else profile)
+    previous, reporter.profiler = reporter.profiler, profiler
+    try:
+        with reporter.stage("审核总计"):
+            all_generated_files, stats_summary = _run_full_audit(
+                uploaded_files, reporter, workers, ref_cache, baseline, chunk_rows, artifacts, lazy_reports
+            )
+    finally:
+        reporter.profiler = previous
+        if profiler is not None:
+            profiler.finish()
+    stats_summary["profile"] = profiler
+    return all_generated_files, stats_summary
+
+def _run_full_audit(uploaded_files, reporter, workers, ref_cache, baseline, chunk_rows, artifacts, lazy_reports):
+    workers = AUDIT_WORKERS if workers is None else workers
+    chunk_rows = AUDIT_CHUNK_ROWS if chunk_rows is None else chunk_rows
+    lazy_reports = lazy_report_kinds() if lazy_reports is None else tuple(lazy_reports)
+    
+    # --- 1. 📖 文件读取 & 预处理 ---
+    rules = AUDIT_RULES
+    main_file = find_file(uploaded_files, "项目提成")
+    ref_files = {
+        source: find_file(uploaded_files, keyword) for source, keyword in rules.reference_files.items()
+    }
+
+    reporter.info("ℹ️ 正在读取并预处理参考文件...")
+
+    # 主表只打开一次，后续所有读取共用同一个 WorkbookStore；参考文件经 ref_cache 按内容复用
+    if ref_cache is None:
+        ref_cache = ReferenceCache(default_snapshot_store())
+    main_store = WorkbookStore(main_file)
+    # 结果文件写入本次审核的落盘目录；主表另存一份副本，供按需生成结果文件与子进程读取
+    run_artifacts = (artifacts or default_artifact_store()).new_run(lazy_reports, chunk_rows)
+    run_artifacts.put_source(main_file)
+    refs = {source: ref_cache.get(source, f, reporter) for source, f in ref_files.items()}
+
+    # 漏填检查基于放款明细的“提成”sheet
+    commission_df = refs["fk"].raw_df
+    contract_col_comm = refs["fk"].contract_col
+
+    # --- 2. 🗺️ 映射规则：见规则文件 (AUDIT_RULES_PATH)，各 sheet 按列名编译执行计划 ---
+
+    # --- 3. 🚀 预处理 (提取列) ---
+    all_std_dfs = {source: ref.std_df for source, ref in refs.items()}
+    # 各参考表只合并一次，各 sheet 共用
+    with reporter.stage("合并参考表") as st:
+        ref_lookup = RefLookup(all_std_dfs)
+        st.rows = len(ref_lookup.table)
+        # 参考表预处理时已归一化过的合同号记入缓存 (主表、提成 sheet 中相同的原始文本不再重复归一化)；
+        # 提成 sheet 的合同号先编码，并行审核时子进程沿用同一份编码
+        for ref in refs.values():
+            if ref.contract_col is not None and not ref.std_df.empty:
+                ref_lookup.keys.learn(ref.raw_df[ref.contract_col], ref.std_df['__KEY__'])
+        if contract_col_comm is not None:
+            ref_lookup.keys.encode(commission_df[contract_col_comm].dropna())
+    reporter.success("✅ 参考文件预处理完成。")
+
+    # --- 4. 🧾 多sheet循环 ---
+    target_sheets = rules.target_sheets(main_store.sheet_names)
+    
+    sheet_contracts = {}
+    total_errors_all_sheets = 0
+    field_errors = {}
+    all_generated_files = [] # 存储所有 (文件名, BytesIO) 元组
+
+    baselines = {}
+    if baseline is not None:
+        baselines = {s: baseline.sheet(s) for s in target_sheets if baseline.sheet(s) is not None}
+
+    worker_parse_stats = {}
+    if not target_sheets:
+        reporter.warning("⚠️ 未找到目标 sheet。")
+        sheet_results = []
+    elif workers > 1 and len(target_sheets) > 1:
+        sheet_results, worker_parse_stats = audit_sheets_parallel(
+            target_sheets, main_store, ref_lookup, rules, reporter,
+            min(workers, len(target_sheets)), baselines, chunk_rows, run_artifacts,
+        )
+    else:
+        sheet_results = []
+        for sheet_name in target_sheets:
+            with reporter.stage("审核 sheet", sheet_name):
+                sheet_results.append(audit_one_sheet(
+                    sheet_name, main_store, ref_lookup, rules, reporter, baselines.get(sheet_name), chunk_rows,
+                    run_artifacts,
+                ))
+
+    # 按 target_sheets 顺序汇总，与执行方式无关
+    sheet_states = {}
+    for sheet_name, result in zip(target_sheets, sheet_results):
+        if result is None:
+            continue
+        errors, files_dict, contracts, sheet_states[sheet_name] = result
+        
+        # 收集文件
+        all_generated_files.append(files_dict["full_report"])
+        if files_dict["error_report"][0] is not None:
+            all_generated_files.append(files_dict["error_report"])
+        
+        # 统计摘要直接由错误矩阵归约得到
+        total_errors_all_sheets += errors.total
+        for field, count in errors.field_counts().items():
+            field_errors[field] = field_errors.get(field, 0) + count
+        
+        sheet_contracts[sheet_name] = contracts
+
+    reporter.caption(format_parse_summary(
+        [("主表", main_store.parse_counts, main_store.parse_seconds),
+         ("主表", {s: n for s, (n, _) in worker_parse_stats.items()},
+          {s: t for s, (_, t) in worker_parse_stats.items()})]
+        + [(source, ref.parse_counts, ref.parse_seconds) for source, ref in refs.items()]
+    ))
+
+    # --- 5. 🕵️ 漏填检查 ---
+    with reporter.stage("漏填检查", rows=len(commission_df)):
+        漏填合同数, leaky_files_dict, coverage = run_leaky_check(
+            commission_df, contract_col_comm, sheet_contracts, ref_lookup.keys, reporter, run_artifacts
+        )
+    
+    if "leaky_list" in leaky_files_dict:
+        all_generated_files.append(leaky_files_dict["leaky_list"])
+
+    # --- 6. 返回所有结果 ---
+    stats_summary = {
+        "total_errors": total_errors_all_sheets,
+        "field_errors": field_errors,
+        "leaky_count": 漏填合同数,
+        "contract_coverage": coverage,
+        "audit_state": AuditState(sheet_states),
+    }
+    
+    return all_generated_files, stats_summary
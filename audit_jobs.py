@@ -0,0 +1,220 @@
+# =====================================
+# 后台审核任务队列：上传的文件排队，由有并发上限的线程池执行 run_full_audit；
+# 按需生成的结果文件 (LazyReport) 也作为任务在同一队列中生成，不占用页面脚本线程。
+# 页面按任务 id 轮询状态与进度，完成的结果在被淘汰前可随时按 id 取回。
+# 不依赖 Streamlit，app3.py 通过 st.cache_resource 让所有会话共用同一个队列。
+# =====================================
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from audit_engine import AuditProfiler, BufferedReporter, audit_cache_key, run_full_audit
+
+# 同时执行的审核任务数 (环境变量 AUDIT_JOB_WORKERS 可覆盖)，其余任务排队
+AUDIT_JOB_WORKERS = int(os.environ.get("AUDIT_JOB_WORKERS", "1"))
+# 已结束任务的保留时长 (秒) 与最多保留数，超出后按结束时间从早到晚淘汰
+AUDIT_JOB_TTL = int(os.environ.get("AUDIT_JOB_TTL", "3600"))
+AUDIT_JOB_MAX_FINISHED = int(os.environ.get("AUDIT_JOB_MAX_FINISHED", "16"))
+
+QUEUED = "排队中"
+RUNNING = "审核中"
+DONE = "已完成"
+FAILED = "失败"
+
+class JobReporter(BufferedReporter):
+    """记录任务的全部输出事件 (完成后可 replay 到页面)，并保存各进度 key 的最新进度与状态文字供轮询。"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()  # 进度 key -> [进度, 状态文字]
+
+    def _entry(self, key):
+        return self._latest.setdefault(key, [0.0, ""])
+
+    def progress(self, key, fraction):
+        super().progress(key, fraction)
+        with self._lock:
+            self._entry(key)[0] = fraction
+
+    def status(self, key, text):
+        super().status(key, text)
+        with self._lock:
+            self._entry(key)[1] = text
+
+    def latest(self):
+        """[(进度 key, 进度, 状态文字)]，按 key 首次出现的顺序。"""
+        with self._lock:
+            return [(key, fraction, text) for key, (fraction, text) in self._latest.items()]
+
+class AuditJob:
+    """
+    一个审核任务：状态、进度与结果 (all_files, stats)；失败时 error 为引发的异常。
+    task 不为 None 时为其他后台任务 (如生成结果文件)，结果为 task(reporter) 的返回值。
+    """
+
+    def __init__(self, files, cache_key, baseline, task=None, label="审核任务"):
+        self.id = uuid.uuid4().hex
+        self.cache_key = cache_key
+        self.label = label
+        self.status = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.reporter = JobReporter()
+        self.result = None
+        self.error = None
+        self.from_cache = False
+        self._files = files
+        self._baseline = baseline
+        self._task = task
+        self.artifact = None
+        self.profiler = None  # 生成结果文件的任务：耗时并入的审核性能剖析
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    def elapsed(self):
+        """排队结束后的运行秒数 (未开始为 0)。"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+def copy_uploaded_files(uploaded_files):
+    """把上传文件复制为带 name 属性的 BytesIO：页面重跑后上传对象可能失效，任务只持有自己的副本。"""
+    files = []
+    for f in uploaded_files:
+        copy = BytesIO(f.getvalue())
+        copy.name = f.name
+        files.append(copy)
+    return files
+
+class AuditJobQueue:
+    """
+    审核任务队列：submit() 立即返回 AuditJob，任务在后台线程池中按提交顺序执行，
+    同时运行的任务不超过 max_workers。给定 result_cache (AuditResultCache) 时，
+    输入与规则集都未变化的提交直接由缓存完成，完成的任务结果也写入缓存。
+    """
+
+    def __init__(self, max_workers=AUDIT_JOB_WORKERS, result_cache=None, ttl=AUDIT_JOB_TTL,
+                 max_finished=AUDIT_JOB_MAX_FINISHED, **audit_kwargs):
+        self.max_workers = max(1, max_workers)
+        self.result_cache = result_cache
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.audit_kwargs = audit_kwargs  # 透传给 run_full_audit (workers、chunk_rows 等)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="audit_job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, uploaded_files, baseline=None, force=False):
+        """
+        提交一次审核，返回 AuditJob。相同输入的任务仍在队列中、运行中或已完成时直接返回该任务；
+        force=True 时不复用已有任务与缓存，重新审核。
+        缺少输入文件时 audit_cache_key 抛出 FileNotFoundError (提交时即报错，不入队)。
+        """
+        files = copy_uploaded_files(uploaded_files)
+        cache_key = audit_cache_key(files)
+        with self._lock:
+            self._evict()
+            if not force:
+                for job in reversed(self._jobs.values()):
+                    if job.cache_key == cache_key and job.status != FAILED:
+                        return job
+            job = AuditJob(files, cache_key, baseline)
+            self._jobs[job.id] = job
+
+        cached = None if force or self.result_cache is None else self.result_cache.get(cache_key)
+        if cached is not None:
+            job.result, job.from_cache = cached, True
+            job.started = job.finished = time.time()
+            job.status = DONE
+            job._files = job._baseline = None
+        else:
+            self._pool.submit(self._run, job)
+        return job
+
+    def submit_report(self, artifact, profiler=None):
+        """
+        把按需生成的结果文件 (LazyReport) 放入队列生成，返回 AuditJob (结果为生成的 Artifact)；
+        同一文件的生成任务仍在队列中、运行中或已完成时直接返回该任务。
+        给定 profiler (所属审核的 stats["profile"]) 时，生成耗时并入该次审核的性能剖析。
+        """
+        cache_key = ("report", id(artifact))
+        with self._lock:
+            self._evict()
+            for job in reversed(self._jobs.values()):
+                if job.cache_key == cache_key and job.status != FAILED:
+                    return job
+            job = AuditJob(None, cache_key, None, task=artifact.materialize, label=f"生成 {artifact.filename}")
+            job.artifact = artifact  # 任务存在期间 id(artifact) 不会被复用
+            job.profiler = profiler
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        job.started = time.time()
+        job.status = RUNNING
+        try:
+            if job._task is not None:
+                self._run_task(job)
+            else:
+                job.result = run_full_audit(
+                    job._files, reporter=job.reporter, baseline=job._baseline, **self.audit_kwargs
+                )
+                if self.result_cache is not None:
+                    self.result_cache.put(job.cache_key, job.result)
+            job.status = DONE
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job._files = job._baseline = job._task = None  # 输入副本不再需要
+            job.finished = time.time()
+
+    def _run_task(self, job):
+        # 与所属审核相同的剖析设置，结束后记录并入该次审核
+        profiler = None if job.profiler is None else AuditProfiler(memory=job.profiler.memory)
+        job.reporter.profiler = profiler
+        try:
+            job.result = job._task(job.reporter)
+        finally:
+            job.reporter.profiler = None
+            if profiler is not None:
+                profiler.finish()
+                job.profiler.merge(profiler)
+
+    def get(self, job_id):
+        """按 id 取任务；已被淘汰或不存在时返回 None。"""
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """排队中的任务前面还有几个排队任务 (不在排队时为 0)。"""
+        if job.status != QUEUED:
+            return 0
+        with self._lock:
+            ahead = 0
+            for other in self._jobs.values():
+                if other is job:
+                    break
+                ahead += other.status == QUEUED
+            return ahead
+
+    def _evict(self, now=None):
+        # 只淘汰已结束的任务：超过保留时长的先删，其余按结束时间保留最近 max_finished 个
+        now = time.time() if now is None else now
+        finished = sorted((j for j in self._jobs.values() if j.done), key=lambda j: j.finished)
+        expired = [j for j in finished if now - j.finished > self.ttl]
+        kept = [j for j in finished if now - j.finished <= self.ttl]
+        expired += kept[:max(0, len(kept) - self.max_finished)]
+        for job in expired:
+            del self._jobs[job.id]
@@ -0,0 +1,225 @@
+# =====================================
+# 基准测试：在合成数据上运行 run_full_audit，按阶段 (AuditProfiler) 记录耗时，
+# 结果存为 bench/results/*.json (带 git 提交号)，便于跨提交对比；文字摘要追加到 bench_output.txt。
+# 用法:
+#   python bench/run_bench.py --rows 1000 10000 100000 --repeat 3
+#   python bench/run_bench.py --compare bench/results/旧.json bench/results/新.json
+# 完全离线运行，合成数据按参数缓存在 bench/data 下。
+# =====================================
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+import pandas as pd
+
+from audit_cli import read_month_files
+from audit_engine import (
+    AUDIT_RULES, AuditReporter, RefLookup, ReferenceCache, find_file, load_reference, run_full_audit,
+)
+from synth_workbooks import BenchSpec, ensure_dataset
+
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+OUTPUT_TXT = os.path.join(REPO_DIR, "bench_output.txt")
+
+def git_revision():
+    """当前提交号；工作区有未提交修改时加 +dirty。"""
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return rev + ("+dirty" if dirty else "")
+
+def stage_totals(profiler):
+    """同名阶段 (各 sheet 的同一规则、各分块) 合计：{阶段: {"wall", "cpu", "rows", "calls"}}。"""
+    totals = {}
+    for r in profiler.records:
+        t = totals.setdefault(r.name, {"wall": 0.0, "cpu": 0.0, "rows": 0, "calls": 0})
+        t["wall"] += r.wall
+        t["cpu"] += r.cpu
+        t["rows"] += r.rows or 0
+        t["calls"] += 1
+    return totals
+
+def _frame_mb(df):
+    return df.memory_usage(index=True, deep=True).sum() / 2**20
+
+def _as_object_frame(df):
+    """紧凑类型 (category、Arrow 字符串) 还原为 object 列，即改用紧凑类型之前的内存占用。"""
+    return df.astype({col: object for col, dtype in df.dtypes.items()
+                      if isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype))})
+
+def frame_memory(month_dir):
+    """各标准参考表 (ec_std / fk_std / product_std) 与合并后的查找表 (merged_df) 的内存 (MB)：改用紧凑类型前后对比。"""
+    files = read_month_files(month_dir)
+    reporter = AuditReporter()
+    std = {
+        f"{source}_std": load_reference(source, find_file(files, keyword), reporter).std_df
+        for source, keyword in AUDIT_RULES.reference_files.items()
+    }
+    frames = dict(std, merged_df=RefLookup(std).table)
+    return {
+        name: {"before_mb": round(_frame_mb(_as_object_frame(df)), 3), "after_mb": round(_frame_mb(df), 3)}
+        for name, df in frames.items()
+    }
+
+def bench_one(spec, repeat, workers, chunk_rows):
+    """同一数据集运行 repeat 次，各阶段取中位数。"""
+    month_dir = ensure_dataset(spec, DATA_DIR)
+    runs = []
+    for _ in range(repeat):
+        files = read_month_files(month_dir)
+        # 每次新建 ReferenceCache 且不用参考快照，参考文件每次都重新解析；结果文件全部在审核内生成并计时
+        t0 = time.perf_counter()
+        _, stats = run_full_audit(
+            files, workers=workers, ref_cache=ReferenceCache(), chunk_rows=chunk_rows, profile="1",
+            lazy_reports=(),
+        )
+        wall = time.perf_counter() - t0
+        runs.append((wall, stats))
+
+    stages = {}
+    for name in stage_totals(runs[0][1]["profile"]):
+        per_run = [stage_totals(stats["profile"]).get(name) for _, stats in runs]
+        per_run = [t for t in per_run if t is not None]
+        stages[name] = {
+            "wall_s": round(statistics.median(t["wall"] for t in per_run), 6),
+            "thread_cpu_s": round(statistics.median(t["cpu"] for t in per_run), 6),
+            "rows": per_run[0]["rows"],
+            "calls": per_run[0]["calls"],
+        }
+    peak_rss = [r.process_peak_rss_mb for _, stats in runs for r in stats["profile"].records if r.process_peak_rss_mb]
+    return {
+        "spec": spec.as_dict(),
+        "workers": workers,
+        "chunk_rows": chunk_rows,
+        "repeat": repeat,
+        "wall_s": round(statistics.median(w for w, _ in runs), 6),
+        "wall_s_all": [round(w, 6) for w, _ in runs],
+        "process_peak_rss_mb": max(peak_rss) if peak_rss else None,
+        "total_errors": int(runs[0][1]["total_errors"]),
+        "leaky_count": int(runs[0][1]["leaky_count"]),
+        "stages": stages,
+        "frame_memory": frame_memory(month_dir),
+    }
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def format_result(result):
+    lines = [
+        f"== rows={result['spec']['rows']} err={result['spec']['error_rate']} dup={result['spec']['dup_ratio']} "
+        f"header={result['spec']['header_offset']} workers={result['workers']} chunk={result['chunk_rows']}: "
+        f"{result['wall_s']:.3f}s (错误 {result['total_errors']}, 漏填 {result['leaky_count']}, "
+        f"进程RSS峰值 {result['process_peak_rss_mb'] or 0:.0f}MB)"
+    ]
+    for name, s in sorted(result["stages"].items(), key=lambda kv: -kv[1]["wall_s"]):
+        lines.append(f"  {s['wall_s']:9.3f}s  线程CPU {s['thread_cpu_s']:9.3f}s  rows {s['rows']:>9}  x{s['calls']:<5} {name}")
+    for name, m in result.get("frame_memory", {}).items():
+        lines.append(f"  内存 {name:<12} {m['before_mb']:9.2f}MB -> {m['after_mb']:9.2f}MB")
+    return "\n".join(lines)
+
+# =====================================
+# 🔍 对比两次结果
+# =====================================
+def _result_key(result):
+    spec = result["spec"]
+    return (spec["rows"], spec["error_rate"], spec["dup_ratio"], spec["header_offset"], spec["seed"],
+            result["workers"], result["chunk_rows"])
+
+def compare(path_a, path_b):
+    """按相同参数配对两次运行，输出各阶段耗时及 B/A 比值。"""
+    with open(path_a, encoding="utf-8") as fh:
+        a = json.load(fh)
+    with open(path_b, encoding="utf-8") as fh:
+        b = json.load(fh)
+    lines = [f"A: {a['revision']} ({a['created']})", f"B: {b['revision']} ({b['created']})"]
+    results_b = {_result_key(r): r for r in b["results"]}
+    for ra in a["results"]:
+        rb = results_b.get(_result_key(ra))
+        if rb is None:
+            continue
+        lines.append(f"== rows={ra['spec']['rows']} workers={ra['workers']} chunk={ra['chunk_rows']}")
+        lines.append(f"  {'总计':<30} {ra['wall_s']:9.3f}s -> {rb['wall_s']:9.3f}s  x{rb['wall_s'] / ra['wall_s']:.2f}")
+        if (ra["total_errors"], ra["leaky_count"]) != (rb["total_errors"], rb["leaky_count"]):
+            lines.append(f"  ⚠️ 审核结果不同: 错误 {ra['total_errors']} -> {rb['total_errors']}，"
+                         f"漏填 {ra['leaky_count']} -> {rb['leaky_count']}")
+        for name in sorted(set(ra["stages"]) | set(rb["stages"]),
+                           key=lambda k: -ra["stages"].get(k, {"wall_s": 0})["wall_s"]):
+            wa = ra["stages"].get(name, {}).get("wall_s")
+            wb = rb["stages"].get(name, {}).get("wall_s")
+            ratio = f"x{wb / wa:.2f}" if wa and wb is not None else ""
+            fa = f"{wa:9.3f}s" if wa is not None else f"{'-':>10}"
+            fb = f"{wb:9.3f}s" if wb is not None else f"{'-':>10}"
+            lines.append(f"  {name:<30} {fa} -> {fb}  {ratio}")
+    return "\n".join(lines)
+
+# =====================================
+# 🚀 入口
+# =====================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="在合成数据上对 run_full_audit 分阶段计时。")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000],
+                        help="合同数，可给多个 (如 1000 10000 100000 500000)")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--dup-ratio", type=float, default=0.02)
+    parser.add_argument("--header-offset", type=int, choices=[0, 1], default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="每组参数运行次数，取中位数 (默认 3)")
+    parser.add_argument("--workers", type=int, default=1, help="sheet 并行进程数 (默认 1)")
+    parser.add_argument("--chunk-rows", type=int, default=0, help="流式分块审核的块大小 (默认 0 为整表)")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"), help="对比两个结果文件，不运行基准")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        print(compare(*args.compare))
+        return 0
+
+    revision = git_revision()
+    created = dt.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    results = []
+    for rows in args.rows:
+        spec = BenchSpec(rows, args.error_rate, args.dup_ratio, args.header_offset, args.seed)
+        result = bench_one(spec, args.repeat, args.workers, args.chunk_rows)
+        results.append(result)
+        print(format_result(result), flush=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{created.replace(':', '')}_{revision}.json")
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"revision": revision, "created": created, "environment": environment(),
+                   "results": results}, fh, ensure_ascii=False, indent=2)
+    with open(OUTPUT_TXT, "a", encoding="utf-8") as fh:
+        fh.write(f"# {created} {revision}\n")
+        fh.write("\n".join(format_result(r) for r in results) + "\n\n")
+    print(f"结果已保存: {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
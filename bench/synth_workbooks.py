@@ -0,0 +1,214 @@
+# =====================================
+# 基准测试用的合成输入：按 项目提成 / 放款明细 / 二次明细 / 产品台账 的表结构生成 4 个 xlsx 文件。
+# 行数、错误率、表头偏移、重复合同号比例可配置；同一组参数 (含 seed) 生成的内容完全相同。
+# 用法: python bench/synth_workbooks.py out/10k --rows 10000 --error-rate 0.05
+# =====================================
+
+import argparse
+import datetime as dt
+import os
+
+import numpy as np
+
+try:
+    # 可选依赖：安装 XlsxWriter 后大文件生成快得多
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+from openpyxl import Workbook
+
+# 各文件名中需包含的关键词 (与 run_full_audit 的 find_file 一致)
+MAIN_FILE = "2024年10月项目提成.xlsx"
+FK_FILE = "放款明细.xlsx"
+EC_FILE = "2024年二次明细.xlsx"
+PRODUCT_FILE = "产品台账.xlsx"
+
+MAIN_HEADER = [
+    "序号", "合同号", "客户名称", "起租日期", "租赁本金", "收益率", "操作人", "客户经理",
+    "城市经理", "完成二次交接时间", "年化MIN", "年限", "备注",
+]
+# 主表各 sheet：(sheet 名, 占合同的比例)；“起租”“二次”sheet 审核时固定 header=1
+MAIN_SHEETS = [("起租", 0.3), ("二次项目", 0.2), ("平台工", 0.2), ("独立架构", 0.15), ("低价值", 0.15)]
+# 主表中缺失于所有检查 sheet 的合同比例 (漏填检查)
+LEAKY_RATIO = 0.03
+
+PEOPLE = [f"张{c}" for c in "一二三四五六七八九十"] + ["Ｌｉ Ｍing", "wang  wu", None]
+
+class BenchSpec:
+    """一组合成数据的参数。"""
+
+    def __init__(self, rows=1000, error_rate=0.05, dup_ratio=0.02, header_offset=1, seed=0):
+        self.rows = rows                    # 合同数 (参考表与主表各 sheet 合计的行数量级)
+        self.error_rate = error_rate        # 主表每个审核字段被改错的概率
+        self.dup_ratio = dup_ratio          # 参考表与主表中重复合同号所占比例
+        self.header_offset = header_offset  # 平台工/独立架构/低价值 sheet 表头前的标题行数 (0 或 1)
+        self.seed = seed
+
+    def as_dict(self):
+        return {
+            "rows": self.rows, "error_rate": self.error_rate, "dup_ratio": self.dup_ratio,
+            "header_offset": self.header_offset, "seed": self.seed,
+        }
+
+    def dirname(self):
+        return (f"rows{self.rows}_err{self.error_rate:g}_dup{self.dup_ratio:g}"
+                f"_h{self.header_offset}_seed{self.seed}")
+
+# =====================================
+# 📝 写 xlsx
+# =====================================
+def _write_workbook(path, sheets):
+    """sheets: [(sheet 名, 行列表)]。优先 xlsxwriter (constant_memory)，未安装时退回 openpyxl write_only。"""
+    if xlsxwriter is not None:
+        wb = xlsxwriter.Workbook(path, {"constant_memory": True})
+        date_fmt = wb.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        for title, rows in sheets:
+            ws = wb.add_worksheet(title)
+            for r, row in enumerate(rows):
+                for c, v in enumerate(row):
+                    if v is None:
+                        continue
+                    if isinstance(v, dt.datetime):
+                        ws.write_datetime(r, c, v, date_fmt)
+                    elif isinstance(v, str):
+                        ws.write_string(r, c, v)
+                    else:
+                        ws.write_number(r, c, v)
+        wb.close()
+        return
+    wb = Workbook(write_only=True)
+    for title, rows in sheets:
+        ws = wb.create_sheet(title)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+# =====================================
+# 🎲 生成
+# =====================================
+def generate(spec, out_dir):
+    """按 spec 在 out_dir 下生成 4 个输入文件，返回文件路径列表。"""
+    rng = np.random.default_rng(spec.seed)
+    os.makedirs(out_dir, exist_ok=True)
+    n = spec.rows
+    keys = [f"HT2024-{i:07d}" for i in range(n)]
+    base = dt.datetime(2024, 1, 1)
+    start = [base + dt.timedelta(days=int(d)) for d in rng.integers(0, 400, n)]
+    handover = [s + dt.timedelta(days=int(d)) for s, d in zip(start, rng.integers(0, 60, n))]
+    principal = rng.integers(50, 500, n) * 1000.0
+    xirr = np.round(rng.uniform(0.05, 0.15, n), 4)
+    term = rng.integers(1, 6, n)
+    operator = [PEOPLE[i] for i in rng.integers(0, len(PEOPLE), n)]
+    manager = [PEOPLE[i] for i in rng.integers(0, len(PEOPLE), n)]
+    # 城市经理为空 / 0 时该字段跳过比对
+    blank = rng.random(n) < 0.1
+    manager = [(0 if rng.random() < 0.5 else None) if b else m for m, b in zip(manager, blank)]
+
+    def with_dups(idx):
+        # 随机重复一部分合同号 (参考表取首条，主表重复行各自比对)
+        dups = rng.choice(idx, int(len(idx) * spec.dup_ratio)) if len(idx) else []
+        return list(idx) + list(dups)
+
+    # 二次明细：部分日期为文本
+    ec_rows = [["合同号", "客户", "起租日_商", "出本流程时间", "备注"]]
+    for i in with_dups(range(n)):
+        d = start[i] if i % 7 else start[i].strftime("%Y-%m-%d")
+        ec_rows.append([keys[i], f"客户{i}", d, handover[i], "x"])
+
+    # 产品台账：部分收益率为百分比文本或 "-"
+    pr_rows = [["合同号", "产品", "起租日_商", "XIRR_商_起租"] + [f"col{j}" for j in range(10)]]
+    for i in with_dups(range(n)):
+        x = xirr[i]
+        xv = f"{x * 100:.2f}%" if i % 9 == 0 else ("-" if i % 97 == 0 else float(x))
+        pr_rows.append([keys[i], "轻卡", start[i], xv] + list(range(10)))
+
+    # 放款明细：两个“提成”sheet 加一个无关 sheet；部分本金为千分位文本，部分合同号为全角横线
+    def fk_rows(idx):
+        rows = [["合同编号", "租赁本金", "提报人员", "城市经理", "租赁期限", "其他"]]
+        for i in with_dups(idx):
+            p = float(principal[i])
+            pv = f"{p:,.2f}" if i % 11 == 0 else p
+            k = keys[i].replace("-", "－") if i % 13 == 0 else keys[i]
+            rows.append([k, pv, operator[i], manager[i], int(term[i]), "y"])
+        return rows
+
+    half = n // 2
+    fk_sheets = [("提成1", fk_rows(range(half))), ("汇总", [["a"], [1]]), ("提成2", fk_rows(range(half, n)))]
+
+    # 项目提成：按比例分到各 sheet，按 error_rate 改错字段，并混入文本日期/数值与大小写、空格不一的合同号
+    def main_rows(idx, title_rows):
+        rows = [["项目提成表"] + [None] * (len(MAIN_HEADER) - 1) for _ in range(title_rows)]
+        rows.append(MAIN_HEADER)
+        for j, i in enumerate(idx):
+            e = rng.random(len(MAIN_HEADER)) < spec.error_rate
+            s = start[i] + dt.timedelta(days=3) if e[3] else start[i]
+            if j % 17 == 0:
+                s = s.strftime("%Y/%m/%d")
+            p = float(principal[i]) + (1000 if e[4] else 0)
+            if j % 23 == 0:
+                p = f"{p:,.0f}"
+            x = float(xirr[i]) + (0.01 if e[5] else 0)
+            if j % 19 == 0:
+                x = f"{x * 100:.2f}%"
+            o = operator[i] if not e[6] else "错人"
+            c = manager[i] if not e[8] else "错经理"
+            h = handover[i] + (dt.timedelta(days=1) if e[9] else dt.timedelta(0))
+            t = int(term[i]) + (1 if e[11] else 0)
+            k = keys[i] if j % 29 else keys[i].lower()
+            if j % 31 == 0:
+                k = f" {k} "
+            cust_mgr = o if j % 3 else (None if e[7] else o)
+            rows.append([j + 1, k, f"客户{i}", s, p, x, o, cust_mgr, c, h, x, t, None])
+        # 一个在参考表中不存在的合同号
+        rows.append([len(idx) + 1, "HT-UNKNOWN-1", "?", base, 1, 0.1, "x", "x", "x", base, 0.1, 1, None])
+        return rows
+
+    perm = rng.permutation(n)[: n - int(n * LEAKY_RATIO)]
+    bounds = np.cumsum([0] + [share for _, share in MAIN_SHEETS])
+    main_sheets = []
+    for (title, _), lo, hi in zip(MAIN_SHEETS, bounds[:-1], bounds[1:]):
+        idx = with_dups(perm[int(lo * len(perm)):int(hi * len(perm))])
+        # get_header_row 对“起租”“二次”固定取 header=1，其余 sheet 按首行是否为空自动判断
+        title_rows = 1 if any(k in title for k in ["起租", "二次"]) else spec.header_offset
+        main_sheets.append((title, main_rows(idx, title_rows)))
+    main_sheets.append(("说明", [["说明"], ["无"]]))
+
+    paths = []
+    for name, sheets in [
+        (MAIN_FILE, main_sheets), (FK_FILE, fk_sheets),
+        (EC_FILE, [("Sheet1", ec_rows)]), (PRODUCT_FILE, [("台账", pr_rows)]),
+    ]:
+        path = os.path.join(out_dir, name)
+        _write_workbook(path, sheets)
+        paths.append(path)
+    return paths
+
+def ensure_dataset(spec, data_dir):
+    """数据集按参数缓存在 data_dir 下，已生成过则直接复用。"""
+    out_dir = os.path.join(data_dir, spec.dirname())
+    done = os.path.join(out_dir, ".complete")
+    if not os.path.exists(done):
+        generate(spec, out_dir)
+        open(done, "w").close()
+    return out_dir
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="生成基准测试用的 4 个合成输入文件。")
+    parser.add_argument("out_dir", help="输出目录")
+    parser.add_argument("--rows", type=int, default=1000, help="合同数 (默认 1000)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="主表字段出错概率 (默认 0.05)")
+    parser.add_argument("--dup-ratio", type=float, default=0.02, help="重复合同号比例 (默认 0.02)")
+    parser.add_argument("--header-offset", type=int, choices=[0, 1], default=1,
+                        help="平台工/独立架构/低价值 sheet 表头前的标题行数 (默认 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    spec = BenchSpec(args.rows, args.error_rate, args.dup_ratio, args.header_offset, args.seed)
+    for path in generate(spec, args.out_dir):
+        print(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# =====================================
+# 归一化与比对的模糊测试：审核流程使用的向量化实现 (_num_parts、normalize_text_codes、
+# na_like_vec、ColumnView + compare_views) 与逐元素的 normalize_num / normalize_text
+# 及最初基于 Series.apply 的整列比对逐行一致。输入按固定种子随机生成，结果可复现。
+# 用法: python -m pytest -q tests
+# =====================================
+
+import datetime as dt
+import os
+import random
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_engine import (
+    ColumnView,
+    _apply_num_upcast,
+    _category_column,
+    _num_parts,
+    compare_views,
+    na_like_vec,
+    normalize_num,
+    normalize_text,
+    normalize_text_codes,
+)
+
+SEEDS = range(8)
+TRIALS = 150
+COMPARE_TYPES = [("text", 0), ("num", 0), ("num", 0.005), ("num_term", 0), ("date", 0)]
+
+# =====================================
+# 🧪 逐元素参照实现 (向量化之前的 compare_series_vec)
+# =====================================
+def compare_series_apply(s_main, s_ref, compare_type='text', tolerance=0):
+    merge_failed_mask = s_ref.isna()
+    main_is_na = pd.isna(s_main) | (s_main.astype(str).str.strip().isin(["", "nan", "None"]))
+    ref_is_na = pd.isna(s_ref) | (s_ref.astype(str).str.strip().isin(["", "nan", "None"]))
+    both_are_na = main_is_na & ref_is_na
+
+    errors = pd.Series(False, index=s_main.index)
+
+    if compare_type == 'date':
+        d_main = pd.to_datetime(s_main, errors='coerce')
+        d_ref = pd.to_datetime(s_ref, errors='coerce')
+
+        valid_dates_mask = d_main.notna() & d_ref.notna()
+        date_diff_mask = (d_main.dt.date != d_ref.dt.date)
+        errors = valid_dates_mask & date_diff_mask
+
+        one_is_date_one_is_not = (d_main.notna() & d_ref.isna() & ~ref_is_na) | \
+                                 (d_main.isna() & ~main_is_na & d_ref.notna())
+        errors |= one_is_date_one_is_not
+
+    elif compare_type in ['num', 'num_term']:
+        s_main_norm = s_main.apply(normalize_num)
+        s_ref_norm = s_ref.apply(normalize_num)
+
+        is_num_main = s_main_norm.apply(lambda x: isinstance(x, (int, float)))
+        is_num_ref = s_ref_norm.apply(lambda x: isinstance(x, (int, float)))
+        both_are_num = is_num_main & is_num_ref
+
+        if both_are_num.any():
+            diff = (s_main_norm[both_are_num] - s_ref_norm[both_are_num]).abs()
+
+            if compare_type == 'num_term':
+                errors.loc[both_are_num] = (diff >= 1.0)
+            else:
+                errors.loc[both_are_num] = (diff > (tolerance + 1e-6))
+
+        one_is_num_one_is_not = (is_num_main & ~is_num_ref & ~ref_is_na) | \
+                                (~is_num_main & ~main_is_na & is_num_ref)
+        errors |= one_is_num_one_is_not
+
+    else:
+        s_main_norm_text = s_main.apply(normalize_text)
+        s_ref_norm_text = s_ref.apply(normalize_text)
+        errors = (s_main_norm_text != s_ref_norm_text)
+
+    final_errors = errors & ~both_are_na
+    lookup_failure_mask = merge_failed_mask & ~main_is_na
+    final_errors = final_errors & ~lookup_failure_mask
+
+    return final_errors
+
+# =====================================
+# 🎲 随机输入
+# =====================================
+TEXT_VALUES = [
+    "张三", " 张三 ", "张　三", "ＡＢＣ", "abc", "Li\tMing", "li ming\n", "Ｌｉ Ｍing", "wang  wu",
+    "", " ", "nan", "None", "NaN", "0", "1", "1.0", 0, 1, 12, 1.0, 2.5, True, False, None, np.nan,
+]
+NUM_VALUES = [
+    0, 1, 12, -3, 1.0, 2.5, 1000.0, 1e-7, np.nan, None, True, False, np.int64(7), np.float64(0.05),
+    "1,000", "1,234.50", " 12 ", "5%", "12.5%", "-", "", "nan", "NaN", "abc", "１２", "1_000", "1e3", "inf",
+    "10000000000000000000000", "0.05", dt.datetime(2024, 1, 1),
+]
+
+def random_date(rng):
+    d = dt.datetime(2000, 1, 1) + dt.timedelta(days=rng.randint(0, 9000), seconds=rng.choice([0, 43200, 86399]))
+    r = rng.random()
+    if r < 0.3:
+        return d
+    if r < 0.4:
+        return pd.Timestamp(d)
+    if r < 0.45:
+        return d.date()
+    if r < 0.75:
+        return d.strftime(rng.choice(["%Y-%m-%d", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S", "%Y%m%d", "%Y年%m月%d日"]))
+    if r < 0.85:
+        return rng.choice(["", "nan", "NaT", "abc", "2024-13-01", " "])
+    if r < 0.93:
+        return rng.choice([None, np.nan, pd.NaT])
+    return rng.choice([45000, 45000.5, 0, 1.0, True, 20240105])
+
+def random_series(rng, n):
+    """随机一列：混合类型的 object 列，或单一类型的列 (float / int / datetime64)。"""
+    kind = rng.choice(["text", "num", "date", "mixed", "float", "int", "datetime"])
+    if kind == "float":
+        return pd.Series([rng.choice([np.nan, 1.0, 2.0, rng.random() * 100]) for _ in range(n)])
+    if kind == "int":
+        return pd.Series([rng.randint(-5, 5) for _ in range(n)], dtype=np.int64)
+    if kind == "datetime":
+        return pd.Series(pd.to_datetime([dt.datetime(2024, 1, 1) + dt.timedelta(hours=rng.randint(0, 200))
+                                         for _ in range(n)]))
+    if kind == "date":
+        values = [random_date(rng) for _ in range(n)]
+    else:
+        pool = {"text": TEXT_VALUES, "num": NUM_VALUES, "mixed": TEXT_VALUES + NUM_VALUES}[kind]
+        values = [rng.choice(pool) for _ in range(n)]
+    return pd.Series(values, dtype=object)
+
+def with_lookup_misses(rng, s):
+    """参考列：部分行为 NaN (对应 left merge 未命中)。"""
+    miss = np.array([rng.random() < 0.15 for _ in range(len(s))], dtype=bool)
+    if not miss.any():
+        return s
+    return s.astype(object).where(~miss, np.nan)
+
+def series_cases(seed):
+    rng = random.Random(seed)
+    for _ in range(TRIALS):
+        n = rng.randint(1, 30)
+        yield rng, random_series(rng, n), random_series(rng, n)
+
+# =====================================
+# ✅ 逐元素归一化
+# =====================================
+@pytest.mark.parametrize("seed", SEEDS)
+def test_num_parts_match_normalize_num(seed):
+    for _, s, _ in series_cases(seed):
+        expected = s.apply(normalize_num)
+        values, is_num, is_str = _num_parts(s)
+        is_num = _apply_num_upcast(is_num, is_str)
+        expected_num = expected.apply(lambda x: isinstance(x, (int, float))).to_numpy(dtype=bool)
+        assert np.array_equal(is_num, expected_num), list(s)
+        expected_values = pd.to_numeric(expected[expected_num], errors="coerce").to_numpy(dtype=float)
+        assert np.array_equal(values[is_num], expected_values, equal_nan=True), list(s)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_text_codes_match_normalize_text(seed):
+    for _, s, _ in series_cases(seed):
+        expected = s.apply(normalize_text).tolist()
+        codes, vocab = normalize_text_codes(s)
+        assert vocab[codes].tolist() == expected, list(s)
+        assert vocab[0] == "" and len(set(vocab)) == len(vocab)
+        cat = _category_column(s.astype(object), max_ratio=1.0)
+        if cat is not None:
+            codes, vocab = normalize_text_codes(cat)
+            assert vocab[codes].tolist() == expected, list(s)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_na_like_matches_string_check(seed):
+    for _, s, _ in series_cases(seed):
+        expected = (pd.isna(s) | s.astype(str).str.strip().isin(["", "nan", "None"])).to_numpy()
+        assert np.array_equal(na_like_vec(s).to_numpy(), expected), list(s)
+        cat = _category_column(s.astype(object), max_ratio=1.0)
+        if cat is not None:
+            assert np.array_equal(na_like_vec(cat).to_numpy(), expected), list(s)
+
+# =====================================
+# ✅ 整列比对
+# =====================================
+def _outcome(fn):
+    # 参照实现抛出异常时，向量化实现应抛出同类异常
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return fn().to_numpy()
+    except Exception as e:
+        return type(e)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_compare_views_match_apply(seed):
+    for rng, s_main, s_ref in series_cases(seed):
+        s_ref = with_lookup_misses(rng, s_ref)
+        refs = [s_ref]
+        cat = _category_column(s_ref.astype(object), max_ratio=1.0) if s_ref.dtype == object else None
+        if cat is not None:
+            refs.append(cat)  # 参考表中的低基数文本列以 category 存储
+        for compare_type, tolerance in COMPARE_TYPES:
+            expected = _outcome(lambda: compare_series_apply(s_main, s_ref, compare_type, tolerance))
+            for ref in refs:
+                got = _outcome(lambda: compare_views(
+                    ColumnView.from_series(s_main, compare_type), ColumnView.from_series(ref, compare_type),
+                    compare_type, tolerance,
+                ))
+                if isinstance(expected, np.ndarray) and isinstance(got, np.ndarray):
+                    assert np.array_equal(got, expected), (compare_type, list(s_main), list(ref))
+                else:
+                    assert got == expected, (compare_type, list(s_main), list(ref))
@@ -0,0 +1,57 @@
+# =====================================
+# 性能剖析：tracemalloc 在进程内按引用计数共用，并发的审核任务互不提前停止；
+# 嵌套与交错的阶段各自得到本阶段的内存峰值增量。
+# 用法: python -m pytest -q tests
+# =====================================
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_engine import AuditProfiler
+
+def test_tracing_stops_after_last_profiler_finishes():
+    assert not tracemalloc.is_tracing()
+    first, second = AuditProfiler(memory=True), AuditProfiler(memory=True)
+    with first.stage("任务一"):
+        pass
+    with second.stage("任务二"):
+        first.finish()
+        assert tracemalloc.is_tracing()
+        data = bytearray(4 * 2**20)
+        del data
+    assert tracemalloc.is_tracing()
+    second.finish()
+    assert not tracemalloc.is_tracing()
+    assert second.records[0].process_peak_traced_mb > 3.9
+
+def test_interleaved_stages_keep_their_peaks():
+    first, second = AuditProfiler(memory=True), AuditProfiler(memory=True)
+    try:
+        with first.stage("外层"):
+            data = bytearray(8 * 2**20)
+            del data
+            # 另一任务的阶段开始时重新计峰，不应抹掉外层已达到的峰值
+            with second.stage("并发阶段"):
+                pass
+            with first.stage("内层"):
+                small = bytearray(2**20)
+                del small
+    finally:
+        first.finish()
+        second.finish()
+    peaks = {r.name: r.process_peak_traced_mb for r in first.records + second.records}
+    assert peaks["外层"] > 7.9
+    assert 0.9 < peaks["内层"] < 7.9
+    assert peaks["并发阶段"] < 0.9
+    assert not tracemalloc.is_tracing()
+
+def test_records_label_process_level_values():
+    profiler = AuditProfiler()
+    with profiler.stage("阶段"):
+        pass
+    stage = profiler.records[0].as_dict()
+    assert {"thread_cpu_s", "process_peak_rss_mb", "process_peak_traced_mb"} <= set(stage)
+    assert "进程RSS峰值(MB)" in profiler.summary_frame().columns
@@ -0,0 +1,92 @@
+# =====================================
+# 参考快照的追加读取：参考文件只在末尾追加了行时在快照基础上续读，
+# 原有行 (含末行之前的行) 被修改时整表重读，两种情况的结果都与直接读取一致。
+# 用法: python -m pytest -q tests
+# =====================================
+
+import os
+import sys
+from io import BytesIO
+
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_engine import (
+    REFERENCE_COLUMNS,
+    BufferedReporter,
+    ReferenceSnapshotStore,
+    _frames_identical,
+    load_reference,
+)
+
+COLUMNS = ["合同编号"] + REFERENCE_COLUMNS["fk"]
+
+# =====================================
+# 🧰 构造放款明细
+# =====================================
+def fk_rows(n, start=0):
+    return [
+        [f"HT{i:05d}", 10000 + i, f"员工{i % 7}", f"经理{i % 3}", 12 + i % 4 * 12]
+        for i in range(start, start + n)
+    ]
+
+def fk_file(sheets):
+    """sheets: {sheet 名: 数据行}，返回带 name 属性的 BytesIO。"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.append(COLUMNS)
+        for row in rows:
+            ws.append(row)
+    buf = BytesIO()
+    wb.save(buf)
+    f = BytesIO(buf.getvalue())
+    f.name = "放款明细.xlsx"
+    return f
+
+def load(store, file):
+    reporter = BufferedReporter()
+    table = store.load("fk", file, reporter)
+    appended = any("🧩" in str(event) for event in reporter.events)
+    return table, appended
+
+def assert_same_as_full_read(table, file):
+    expected = load_reference("fk", file, BufferedReporter())
+    assert _frames_identical(table.raw_df, expected.raw_df)
+    assert _frames_identical(table.std_df, expected.std_df)
+
+@pytest.fixture
+def store(tmp_path):
+    return ReferenceSnapshotStore(str(tmp_path))
+
+# =====================================
+# ✅ 追加读取与整表重读
+# =====================================
+def test_appended_rows_reuse_snapshot(store):
+    old = {"提成1": fk_rows(30), "提成2": fk_rows(20, start=100)}
+    load(store, fk_file(old))
+    new = {"提成1": old["提成1"] + fk_rows(5, start=30), "提成2": old["提成2"] + fk_rows(3, start=120)}
+    table, appended = load(store, fk_file(new))
+    assert appended
+    assert_same_as_full_read(table, fk_file(new))
+
+    # 在追加结果的快照上继续追加
+    newer = {"提成1": new["提成1"] + fk_rows(4, start=40), "提成2": new["提成2"]}
+    table, appended = load(store, fk_file(newer))
+    assert appended
+    assert_same_as_full_read(table, fk_file(newer))
+
+@pytest.mark.parametrize("edit_row", [0, 9, 28])
+def test_edited_old_row_with_appended_rows_reloads(store, edit_row):
+    old = {"提成1": fk_rows(30)}
+    load(store, fk_file(old))
+    rows = [list(r) for r in old["提成1"]]
+    rows[edit_row][2] = "改后人员"
+    new = {"提成1": rows + fk_rows(100, start=30)}
+    table, appended = load(store, fk_file(new))
+    assert not appended
+    assert_same_as_full_read(table, fk_file(new))
+    assert (table.raw_df["提报人员"] == "改后人员").sum() == 1